@@ -3,6 +3,7 @@ from .criterion import *
 from .logger import *
 from .metric import *
 from .model import *
+from .profiler import *
 from .state import *
 from .trigger import *
 from .utils import *
@@ -10,10 +11,11 @@ from .epoch import (
     Epoch, EpochStartEvent, EpochEndEvent, EpochPreprocessLoaderEvent, EpochProcessLoaderEvent,
     EpochPostprocessLoaderEvent
 )
-from .events import RunnerForceStopEvent
+from .events import RunnerForceStopEvent, StateCollectEvent, StateRestoreEvent
 from .loader import (
     Loader, LoaderStartEvent, LoaderEndEvent, LoaderProcessBatchStartEvent, TrainLoader, ValidLoader
 )
+from .sampler import ResumableSampler
 
 from .runner import (
     Runner, RunnerStartEvent, RunnerEndEvent, RunnerPreprocessEpochEvent, RunnerProcessEpochEvent,
@@ -1,8 +1,14 @@
+from .activation import Activation
 from .ansi_color import AnsiColor
+from .compile_mode import CompileMode
 from .console_mode import ConsoleMode
+from .dice_reduction import DiceReduction
 from .flush_type import FlushType
 from .loader_name import LoaderName
+from .log_format import LogFormat
+from .metric_mode import MetricMode
+from .reduce_type import ReduceType
 from .schedule_type import ScheduleType
 from .state_mode import StateMode
 
-__all__ = ["AnsiColor", "ConsoleMode", "FlushType", "LoaderName", "ScheduleType", "StateMode"]
+__all__ = ["Activation", "AnsiColor", "CompileMode", "ConsoleMode", "DiceReduction", "FlushType", "LoaderName", "LogFormat", "MetricMode", "ReduceType", "ScheduleType", "StateMode"]
@@ -0,0 +1,3 @@
+class Activation:
+    Sigmoid = "sigmoid"
+    Softmax = "softmax"
@@ -34,4 +34,6 @@ class AnsiColor:
     B_LightBlue = "\x1b[104m"
     B_LightMagenta = "\x1b[105m"
     B_LightCyan = "\x1b[106m"
-    B_White = "\x1b[107m"
\ No newline at end of file
+    B_White = "\x1b[107m"
+    # Control
+    EraseLine = "\x1b[K"
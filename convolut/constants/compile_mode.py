@@ -0,0 +1,4 @@
+class CompileMode:
+    Trace = "trace"
+    Script = "script"
+    Compile = "compile"
@@ -0,0 +1,9 @@
+class DiceReduction:
+    # every sample and class pooled into one score, the batch is treated as a single volume
+    Micro = "micro"
+    # per class scores pooled over the batch, averaged with equal weights
+    Macro = "macro"
+    # per class scores pooled over the batch, averaged with the given or the target's class weights
+    Weighted = "weighted"
+    # a [batch, classes] tensor of per sample scores
+    NoReduction = "none"
@@ -0,0 +1,3 @@
+class LogFormat:
+    Text = "text"
+    JsonLines = "jsonl"
@@ -0,0 +1,3 @@
+class MetricMode:
+    Min = "min"
+    Max = "max"
@@ -0,0 +1,8 @@
+class ReduceType:
+    Mean = "mean"
+    Sum = "sum"
+    Min = "min"
+    Max = "max"
+    Last = "last"
+    Ema = "ema"
+    Variance = "variance"
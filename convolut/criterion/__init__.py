@@ -1,4 +1,4 @@
 from .dice import DiceLoss
-from .bce_dice import BCEDiceLoss
+from .bce_dice import BCEDiceLoss, FusedBCEDiceLoss
 
-__all__ = ["DiceLoss", "BCEDiceLoss"]
+__all__ = ["DiceLoss", "BCEDiceLoss", "FusedBCEDiceLoss"]
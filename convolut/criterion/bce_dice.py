@@ -1,13 +1,16 @@
-from typing import Optional
+from typing import Callable, Optional, Union
 
 import torch
+import torch.nn.functional as F
 from torch import nn
 
+from ..constants import Activation, DiceReduction
 from ..settings import (
     CRITERION_BCEDICE_EPS,
     CRITERION_BCEDICE_THRESHOLD,
     CRITERION_BCEDICE_BCE_WEIGHT,
-    CRITERION_BCEDICE_DICE_WEIGHT
+    CRITERION_BCEDICE_DICE_WEIGHT,
+    CRITERION_BCEDICE_REDUCTION
 )
 from .dice import DiceLoss
 
@@ -18,7 +21,8 @@ class BCEDiceLoss(nn.Module):
                  threshold: float = CRITERION_BCEDICE_THRESHOLD,
                  bce_weight: float = CRITERION_BCEDICE_BCE_WEIGHT,
                  dice_weight: float = CRITERION_BCEDICE_DICE_WEIGHT,
-                 activation: Optional[nn.Module] = nn.Sigmoid,
+                 activation: Optional[Union[str, Callable]] = Activation.Sigmoid,
+                 reduction: str = CRITERION_BCEDICE_REDUCTION,
                  ):
         super().__init__()
 
@@ -31,11 +35,16 @@ class BCEDiceLoss(nn.Module):
         self.bce_weight = bce_weight
         self.dice_weight = dice_weight
 
+        self.eps = eps
+        self.threshold = threshold
+        self.activation = activation
+        self.reduction = reduction
+
         if self.bce_weight != 0:
             self.bce_loss = nn.BCEWithLogitsLoss()
 
         if self.dice_weight != 0:
-            self.dice_loss = DiceLoss(eps=eps, threshold=threshold, activation=activation)
+            self.dice_loss = DiceLoss(eps=eps, threshold=threshold, activation=activation, reduction=reduction)
 
     def forward(self, output: torch.Tensor, target: torch.Tensor):
         if self.bce_weight == 0:
@@ -48,3 +57,66 @@ class BCEDiceLoss(nn.Module):
         bce = self.bce_weight * self.bce_loss(output, target)
 
         return dice + bce
+
+
+class _BCEDiceFunction(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, output, target, bce_weight, dice_weight, eps, threshold):
+        flat_output, flat_target = output.reshape(-1), target.reshape(-1)
+
+        probability = torch.sigmoid(output)
+        target_sum = torch.sum(flat_target)
+        loss = output.new_zeros(())
+
+        if bce_weight != 0:
+            # mean(softplus(x) - x * t) is bce with logits, the products are reduced without full size buffers
+            bce = torch.sum(F.softplus(output)) - torch.dot(flat_output, flat_target)
+            loss = loss + bce_weight * bce / output.numel()
+
+        dice = cardinality = loss
+
+        if dice_weight != 0:
+            prediction = probability if threshold is None else (probability > threshold).to(probability.dtype)
+
+            intersection = torch.dot(prediction.reshape(-1), flat_target)
+            cardinality = torch.sum(prediction) + target_sum + eps
+            dice = 2 * intersection / cardinality
+
+            loss = loss + dice_weight * (1 - dice)
+
+        # only the probabilities are kept, the gradient of both terms is derived from them
+        ctx.save_for_backward(probability, target, dice, cardinality)
+        ctx.bce_weight = bce_weight
+        # a thresholded dice has no gradient, as in BCEDiceLoss
+        ctx.dice_weight = dice_weight if threshold is None else 0
+
+        return loss
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        probability, target, dice, cardinality = ctx.saved_tensors
+
+        grad = torch.sub(probability, target).mul_(ctx.bce_weight / probability.numel())
+
+        if ctx.dice_weight != 0:
+            # d(1 - dice)/dx = -(2 * target - dice) * p * (1 - p) / cardinality, computed in a single buffer
+            dice_grad = torch.mul(target, 2).sub_(dice).mul_(probability)
+            dice_grad.addcmul_(dice_grad, probability, value=-1)
+            grad.sub_(dice_grad.mul_(ctx.dice_weight / cardinality))
+
+        return grad.mul_(grad_output), None, None, None, None, None
+
+
+class FusedBCEDiceLoss(BCEDiceLoss):
+    # the sigmoid is computed once for both terms, other activations and reductions take BCEDiceLoss's path
+    def forward(self, output: torch.Tensor, target: torch.Tensor):
+        if self.activation != Activation.Sigmoid or self.reduction != DiceReduction.Micro \
+                or target.shape != output.shape:
+            return super().forward(output, target)
+
+        if output.dtype in (torch.float16, torch.bfloat16):
+            # sums over large volumes overflow in half precision, autocast runs bce with logits in float32 as well
+            output = output.float()
+
+        return _BCEDiceFunction.apply(output, target.to(output.dtype), self.bce_weight, self.dice_weight, self.eps,
+                                      self.threshold)
@@ -1,11 +1,13 @@
-from typing import Optional
+from typing import Callable, Optional, Union
 
 import torch
 from torch import nn
 from ..utils.dice import dice
 from ..settings import (
     CRITERION_DICE_EPS,
-    CRITERION_DICE_THRESHOLD
+    CRITERION_DICE_THRESHOLD,
+    CRITERION_DICE_ACTIVATION,
+    CRITERION_DICE_REDUCTION
 )
 
 
@@ -13,15 +15,19 @@ class DiceLoss(nn.Module):
     def __init__(self,
                  eps: float = CRITERION_DICE_EPS,
                  threshold: float = CRITERION_DICE_THRESHOLD,
-                 activation: Optional[nn.Module] = nn.Sigmoid(),
+                 activation: Optional[Union[str, Callable]] = CRITERION_DICE_ACTIVATION,
+                 reduction: str = CRITERION_DICE_REDUCTION,
+                 weights: Optional[torch.Tensor] = None,
                  ):
         super().__init__()
 
         self.eps = eps
         self.threshold = threshold
         self.activation = activation
+        self.reduction = reduction
+        self.weights = weights
 
     def forward(self, output: torch.Tensor, target: torch.Tensor):
-        value = dice(output, target, self.eps, self.threshold, self.activation)
+        value = dice(output, target, self.eps, self.threshold, self.activation, self.reduction, self.weights)
 
         return 1 - value
@@ -0,0 +1,29 @@
+from typing import Any, List
+
+import torch.distributed as dist
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized() and dist.get_world_size() > 1
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    return get_rank() == 0
+
+
+def all_gather_object(obj: Any) -> List[Any]:
+    if not is_distributed():
+        return [obj]
+
+    objects = [None] * get_world_size()
+    dist.all_gather_object(objects, obj)
+
+    return objects
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Any, Dict
 
 from decouple import Event
 
@@ -16,3 +17,15 @@ class EpochForceStopEvent(Event):
 @dataclass
 class LoaderForceStopEvent(Event):
     pass
+
+
+# published before a state is saved, modules add the parts they own to the state
+@dataclass
+class StateCollectEvent(Event):
+    state: Dict[str, Any] = None
+    state_type: str = None
+
+
+@dataclass
+class StateRestoreEvent(Event):
+    state: Dict[str, Any] = None
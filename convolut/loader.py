@@ -1,18 +1,102 @@
+import itertools
+import queue
+import threading
+import warnings
 from dataclasses import dataclass
-from typing import Iterator, Optional, Any
+from typing import Any, Callable, Dict, Iterator, Optional
 
+import torch
 from decouple import Module, Mediator, Event
 from .constants.loader_name import LoaderName
+from .distributed import get_rank, get_world_size, is_distributed
 from .events import LoaderForceStopEvent
+from .settings import LOADER_PREFETCH, LOADER_SHARD
+
+
+class _PrefetchError:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class _Prefetcher:
+    _end = object()
+
+    def __init__(self, iterator: Iterator, size: int, stage: Callable[[Any], Any]):
+        self._iterator = iterator
+        self._stage = stage
+        self._queue = queue.Queue(maxsize=size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._exhausted = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._exhausted:
+            raise StopIteration
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+        item = self._queue.get()
+
+        if item is self._end:
+            self._exhausted = True
+            raise StopIteration
+
+        if isinstance(item, _PrefetchError):
+            self._exhausted = True
+            raise item.error
+
+        return item
+
+    def close(self):
+        self._stop.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        try:
+            for batch in self._iterator:
+                if not self._put(self._stage(batch)):
+                    return
+        except Exception as e:
+            self._put(_PrefetchError(e))
+            return
+
+        self._put(self._end)
+
+    def _put(self, item: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
 
 
 class Loader(Module):
-    def __init__(self, name: str, dataloader: Iterator):
+    def __init__(self,
+                 name: str,
+                 dataloader: Iterator,
+                 prefetch: int = LOADER_PREFETCH,
+                 shard: Optional[bool] = LOADER_SHARD,
+                 ):
         super().__init__()
 
         self.name = name
         self._dataloader = dataloader
-        self._iterator = iter(self._dataloader)
+        self._prefetch = prefetch
+        self._shard = shard
+        # created on the first start, once a distributed process group may exist
+        self._iterator: Optional[Iterator] = None
+        # applied to every batch on the prefetch thread, e.g. to copy it to the device ahead of time
+        self._stage_fn: Optional[Callable[[Any], Any]] = None
 
         self._loader_on: bool = False
 
@@ -22,6 +106,13 @@ class Loader(Module):
         self._current_maximum_steps = None
         self._current_restart_iterator = False
 
+        # state of the shuffling generator when the current iterator was created, a resumed pass draws the same order
+        self._generator_state: Optional[torch.Tensor] = None
+
+        # position restored from a checkpoint, applied on the next start
+        self._resume_state: Optional[Dict[str, Any]] = None
+        self._skip_epoch = False
+
     def start(self,
               epoch_index: int,
               maximum_steps: Optional[int],
@@ -43,7 +134,13 @@ class Loader(Module):
         self._loader_on = True
         self._current_step_index = 0
 
-        while self._loader_on and (
+        if self._resume_state is not None:
+            self._resume(epoch_index)
+
+        if self._iterator is None:
+            self._iterator = self._create_iterator()
+
+        while self._loader_on and not self._skip_epoch and (
                 (self._current_maximum_steps and self._current_step_index < self._current_maximum_steps)
                 or self._current_maximum_steps is None):
             # create dataloader's iterator
@@ -69,15 +166,176 @@ class Loader(Module):
             self._current_step_index += 1
             self._current_batch_index += 1
 
+        self._skip_epoch = False
+
         if self._current_restart_iterator:
             self._restart_iterator()
 
         self.end()
 
+    def expected_steps(self) -> Optional[int]:
+        # steps of the current epoch, None when the dataloader has no length
+        if self._current_maximum_steps:
+            return self._current_maximum_steps
+
+        try:
+            length = len(self._dataloader)
+        except TypeError:
+            return None
+
+        if self._sharded():
+            return (length - get_rank() + get_world_size() - 1) // get_world_size()
+
+        return length
+
+    def set_stage_fn(self, stage_fn: Optional[Callable[[Any], Any]]):
+        self._stage_fn = stage_fn
+
+    def state_dict(self) -> Dict[str, Any]:
+        # called from batch handlers while the loader runs, the current batch is already taken from the iterator
+        taken = 1 if self._loader_on else 0
+
+        state = {
+            "epoch_index": self._current_epoch_index,
+            "step_index": self._current_step_index + taken,
+            "batch_index": self._current_batch_index + taken,
+            "finished": not self._loader_on,
+        }
+
+        sampler = self._resumable_sampler()
+        if sampler is not None:
+            state["sampler"] = sampler.state_dict()
+        elif self._generator_state is not None:
+            state["generator"] = self._generator_state
+
+        return state
+
+    def load_state_dict(self, state: Dict[str, Any]):
+        # the iterator is rebuilt right away, creating it may draw from the rng that is restored afterwards
+        if isinstance(self._iterator, _Prefetcher):
+            self._iterator.close()
+
+        self._iterator = self._create_iterator(skip=state["batch_index"],
+                                               sampler_state=state.get("sampler"),
+                                               generator_state=state.get("generator"))
+        self._current_batch_index = state["batch_index"]
+
+        # the position inside the epoch is applied on the next start
+        self._resume_state = state
+
+    def _resume(self, epoch_index: int):
+        state, self._resume_state = self._resume_state, None
+
+        if state["epoch_index"] == epoch_index:
+            if state["finished"]:
+                self._skip_epoch = True
+            else:
+                self._current_step_index = state["step_index"]
+
+    def _resumable_sampler(self):
+        sampler = getattr(self._dataloader, "sampler", None)
+
+        if hasattr(sampler, "seek") and hasattr(sampler, "state_dict"):
+            return sampler
+
+        return None
+
+    def _shuffle_generator(self) -> Optional[torch.Generator]:
+        sampler = getattr(self._dataloader, "sampler", None)
+
+        # RandomSampler and the other torch samplers that shuffle take their order from a generator
+        if not hasattr(sampler, "generator"):
+            return None
+
+        if sampler.generator is None:
+            # without one the sampler seeds itself from the global rng when its pass starts, which a resume
+            # cannot replay, a private generator seeded from the global rng gives the same randomness
+            sampler.generator = torch.Generator()
+            sampler.generator.manual_seed(int(torch.empty((), dtype=torch.int64).random_().item()))
+
+            # a DataLoader also draws its worker seeds from the same generator
+            if getattr(self._dataloader, "generator", False) is None:
+                self._dataloader.generator = sampler.generator
+
+        return sampler.generator
+
+    def _sharded(self) -> bool:
+        if not is_distributed():
+            return False
+
+        if self._shard is None:
+            # a DistributedSampler already shards the dataset
+            sampler = getattr(self._dataloader, "sampler", None)
+            return type(sampler).__name__ != "DistributedSampler"
+
+        return self._shard
+
+    def _create_iterator(self,
+                         skip: int = 0,
+                         sampler_state: Optional[Dict[str, Any]] = None,
+                         generator_state: Optional[torch.Tensor] = None,
+                         ) -> Iterator:
+        sharded = self._sharded()
+        # batches of the unsharded stream
+        skip = skip * get_world_size() if sharded else skip
+
+        sampler = self._resumable_sampler()
+
+        if sampler is not None and sampler_state is not None:
+            sampler.load_state_dict(sampler_state)
+            batch_size = getattr(self._dataloader, "batch_size", None)
+
+            if batch_size:
+                # the pass starts at the first sample of the next batch, no batch is loaded to be thrown away
+                sampler.seek(skip * batch_size)
+                skip = 0
+            else:
+                sampler.seek(0)
+
+        generator = self._shuffle_generator() if sampler is None else None
+
+        if generator is not None:
+            if generator_state is not None:
+                generator.set_state(generator_state)
+
+            self._generator_state = generator.get_state()
+        elif skip and sampler is None and _shuffled(self._dataloader):
+            warnings.warn(f"loader {self.name} resumes a pass of a shuffled sampler without a generator, "
+                          f"the batches read after the resume follow a different order")
+
+        iterator = iter(self._dataloader)
+
+        if skip:
+            # without a resumable sampler the batches have to be read and dropped
+            iterator = itertools.islice(iterator, skip, None)
+
+        if sharded:
+            iterator = itertools.islice(iterator, get_rank(), None, get_world_size())
+
+        if self._prefetch:
+            # batches already queued by the prefetcher survive between epochs the same way
+            # the plain iterator position does, so maximum_steps never drops a batch
+            iterator = _Prefetcher(iterator, self._prefetch, self._stage_batch)
+
+        return iterator
+
+    def _stage_batch(self, batch: Any) -> Any:
+        # looked up per batch, the stage function is set by the model manager on the loader start
+        return self._stage_fn(batch) if self._stage_fn is not None else batch
+
     def _restart_iterator(self):
-        self._iterator = iter(self._dataloader)
+        if isinstance(self._iterator, _Prefetcher):
+            self._iterator.close()
+
+        self._iterator = self._create_iterator()
         self._current_batch_index = 0
 
+    def close(self):
+        # the prefetch thread holds queued batches, it is stopped once the loader is not used anymore
+        if isinstance(self._iterator, _Prefetcher):
+            self._iterator.close()
+            self._iterator = None
+
     def handle_loader_force_stop(self, event: LoaderForceStopEvent):
         self.end()
 
@@ -91,6 +349,13 @@ class Loader(Module):
                                 restart_iterator=self._current_restart_iterator))
 
 
+def _shuffled(dataloader: Iterator) -> bool:
+    sampler = getattr(dataloader, "sampler", None)
+
+    # samplers that are known to keep their order between passes
+    return sampler is not None and type(sampler).__name__ not in ("SequentialSampler", "DistributedSampler")
+
+
 @dataclass
 class LoaderStartEvent(Event):
     loader: Loader = None
@@ -128,15 +393,15 @@ class LoaderProcessBatchEndEvent(Event):
 
 
 class TrainLoader(Loader):
-    def __init__(self, dataloader: Iterator):
-        super().__init__(name=LoaderName.Train, dataloader=dataloader)
+    def __init__(self, dataloader: Iterator, prefetch: int = LOADER_PREFETCH, shard: Optional[bool] = LOADER_SHARD):
+        super().__init__(name=LoaderName.Train, dataloader=dataloader, prefetch=prefetch, shard=shard)
 
 
 class ValidLoader(Loader):
-    def __init__(self, dataloader: Iterator):
-        super().__init__(name=LoaderName.Valid, dataloader=dataloader)
+    def __init__(self, dataloader: Iterator, prefetch: int = LOADER_PREFETCH, shard: Optional[bool] = LOADER_SHARD):
+        super().__init__(name=LoaderName.Valid, dataloader=dataloader, prefetch=prefetch, shard=shard)
 
 
 class InferLoader(Loader):
-    def __init__(self, dataloader: Iterator):
-        super().__init__(name=LoaderName.Infer, dataloader=dataloader)
+    def __init__(self, dataloader: Iterator, prefetch: int = LOADER_PREFETCH, shard: Optional[bool] = LOADER_SHARD):
+        super().__init__(name=LoaderName.Infer, dataloader=dataloader, prefetch=prefetch, shard=shard)
@@ -1,25 +1,47 @@
+import datetime
 import sys
-from typing import Dict
+import time
+from typing import Dict, Optional
 
 from decouple import Module
 
 from ..constants import AnsiColor as Color, ConsoleMode, LoaderName
+from ..distributed import is_main_process
 from ..epoch import EpochStartEvent
 from ..events import RunnerForceStopEvent
-from ..loader import LoaderStartEvent, LoaderProcessBatchEndEvent
+from ..loader import LoaderStartEvent, LoaderEndEvent, LoaderProcessBatchStartEvent, LoaderProcessBatchEndEvent
 from ..metric.metric_manager import MetricManagerFlushEvent
+from ..model.stager import batch_size
 from ..state.events import CheckpointSavedEvent, CheckpointSavingEvent, CheckpointLoadedEvent, CheckpointLoadingEvent
 from ..runner import RunnerStartEvent
-from ..settings import LOGGER_CONSOLE_MODE
+from ..settings import LOGGER_CONSOLE_MODE, LOGGER_CONSOLE_REFRESH_INTERVAL_MS, LOGGER_CONSOLE_PLAIN_INTERVAL_MS
 
 
 class ConsoleLogger(Module):
+    # per-step progress is only subscribed by loggers that draw it
+    draws_progress = True
+
     def __init__(self,
                  mode: str = LOGGER_CONSOLE_MODE,
+                 refresh_interval_ms: int = LOGGER_CONSOLE_REFRESH_INTERVAL_MS,
+                 plain_interval_ms: int = LOGGER_CONSOLE_PLAIN_INTERVAL_MS,
                  ):
         super().__init__()
 
+        if mode not in (ConsoleMode.SingleLine, ConsoleMode.Basic):
+            raise ValueError(f'unknown mode={mode}')
+
         self._mode = mode
+        # redrawing a line only works on a terminal, logs collected from pipes get plain lines less often
+        self._plain = self._mode == ConsoleMode.Basic or not _isatty()
+        self._refresh_interval = (plain_interval_ms if self._plain else refresh_interval_ms) / 1000
+        self._last_render: float = 0.0
+
+        self._current_steps = 0
+        self._current_samples = 0
+        self._current_maximum_steps: Optional[int] = None
+        self._current_loader_started: float = 0.0
+        self._current_loader_ended: Optional[float] = None
 
         self._current_epochs_limit = 0
         self._current_epoch_index = 0
@@ -36,7 +58,7 @@ class ConsoleLogger(Module):
                 .sub(RunnerForceStopEvent, self.handle_runner_force_stop)
                 .sub(EpochStartEvent, self.handle_epoch_start)
                 .sub(LoaderStartEvent, self.handle_loader_start)
-                .sub(LoaderProcessBatchEndEvent, self.handle_loader_process_batch_end)
+                .sub(LoaderEndEvent, self.handle_loader_end)
                 .sub(MetricManagerFlushEvent, self.handle_metric_manager_flush)
                 .sub(CheckpointSavingEvent, self.handle_checkpoint_saving)
                 .sub(CheckpointSavedEvent, self.handle_checkpoint_saved)
@@ -44,6 +66,12 @@ class ConsoleLogger(Module):
                 .sub(CheckpointLoadedEvent, self.handle_checkpoint_loaded)
         )
 
+        if self.draws_progress:
+            (
+                self.sub(LoaderProcessBatchStartEvent, self.handle_loader_process_batch_start)
+                    .sub(LoaderProcessBatchEndEvent, self.handle_loader_process_batch_end)
+            )
+
     def _write_progress_bar(self,
                             epoch_index: int,
                             epochs_limit: int,
@@ -62,28 +90,52 @@ class ConsoleLogger(Module):
         else:
             percent_color_f, percent_color_b = Color.F_Red, Color.B_Red
 
-        epoch_str = f"\repoch {percent_color_f}{epoch_index:0>3}{Color.F_Default}/{epochs_limit:0>3} "
-        if loader_name == LoaderName.Train:
-            loader_str = f"({Color.F_Cyan}{loader_name}{Color.F_Default}) "
-        else:
-            loader_str = f"({Color.F_Magenta}{loader_name}{Color.F_Default}) "
+        epoch_str = f"epoch {self._color(percent_color_f)}{epoch_index:0>3}{self._color(Color.F_Default)}" \
+                    f"/{epochs_limit:0>3} "
+        loader_color = Color.F_Cyan if loader_name == LoaderName.Train else Color.F_Magenta
+        loader_str = f"({self._color(loader_color)}{loader_name}{self._color(Color.F_Default)}) "
 
-        percent_str = f"[{percent_color_b}{arrow}{Color.B_Default}{spaces}] "
+        percent_str = f"[{self._color(percent_color_b)}{arrow}{self._color(Color.B_Default)}{spaces}] "
 
-        text = f"{epoch_str}{loader_str}{percent_str} | {current_text} | {self._info}"
+        text = f"{epoch_str}{loader_str}{percent_str}{self._step_text()} | {current_text} | {self._info}"
         self._write(text)
 
+    def _step_text(self) -> str:
+        total = f"/{self._current_maximum_steps}" if self._current_maximum_steps else ""
+        text = f"step {self._current_steps}{total}"
+
+        ended = self._current_loader_ended if self._current_loader_ended is not None else time.monotonic()
+        elapsed = ended - self._current_loader_started
+        if self._current_steps == 0 or elapsed <= 0:
+            return text
+
+        steps_per_second = self._current_steps / elapsed
+        samples_per_second = self._current_samples / elapsed
+        text = f"{text} {steps_per_second:.1f} it/s {samples_per_second:.1f} samples/s"
+
+        if self._current_maximum_steps:
+            remaining = max(self._current_maximum_steps - self._current_steps, 0) / steps_per_second
+            text = f"{text} eta {datetime.timedelta(seconds=int(remaining))}"
+
+        return text
+
+    def _color(self, color: str) -> str:
+        return "" if self._plain else color
+
     def _write(self, text: str):
-        if self._mode == ConsoleMode.SingleLine:
-            sys.stdout.write(text)
-        elif self._mode == ConsoleMode.Basic:
+        if not is_main_process():
+            return
+
+        if self._plain:
             sys.stdout.write(f'{text}\n')
         else:
-            raise ValueError(f'unknown mode={self._mode}')
+            sys.stdout.write(f'\r{text}{Color.EraseLine}')
 
         sys.stdout.flush()
 
     def _write_progress(self):
+        self._last_render = time.monotonic()
+
         self._write_progress_bar(epoch_index=self._current_epoch_index,
                                  epochs_limit=self._current_epochs_limit,
                                  loader_name=self._current_loader_name,
@@ -94,21 +146,41 @@ class ConsoleLogger(Module):
 
     def handle_runner_force_stop(self, event: RunnerForceStopEvent):
         text = f'runner.force_stop.reason={event.reason}'
-        print(text)
+        if is_main_process():
+            print(text)
 
     def handle_epoch_start(self, event: EpochStartEvent):
         self._current_epoch_index = event.epoch.epoch_index
 
     def handle_loader_start(self, event: LoaderStartEvent):
         self._current_loader_name = event.loader.name
+        # without steps_per_epoch the total comes from the length of the dataloader, if it has one
+        self._current_maximum_steps = event.loader.expected_steps()
+        self._current_steps = 0
+        self._current_samples = 0
+        self._current_loader_started = time.monotonic()
+        self._current_loader_ended = None
 
         self._write_progress()
 
+    def handle_loader_end(self, event: LoaderEndEvent):
+        # throughput shown by later redraws (flushes, checkpoints) stays the one of the finished loader
+        self._current_loader_ended = time.monotonic()
+
+    def handle_loader_process_batch_start(self, event: LoaderProcessBatchStartEvent):
+        # counted from the batch itself, so inference runs without a loss report samples too
+        self._current_samples += batch_size(event.batch) or 0
+
     def handle_loader_process_batch_end(self, event: LoaderProcessBatchEndEvent):
         if event.loader.name not in self._current_global_steps:
             self._current_global_steps[event.loader.name] = 0
 
         self._current_global_steps[event.loader.name] += 1
+        self._current_steps += 1
+
+        # redrawn at most once per interval, however short the steps are
+        if time.monotonic() - self._last_render >= self._refresh_interval:
+            self._write_progress()
 
     def handle_metric_manager_flush(self, event: MetricManagerFlushEvent):
         text = ""
@@ -150,3 +222,8 @@ class ConsoleLogger(Module):
         self._info = f'checkpoint_loaded.{event.checkpoint_type}'
 
         self._write_progress()
+
+
+def _isatty() -> bool:
+    isatty = getattr(sys.stdout, "isatty", None)
+    return bool(isatty and isatty())
@@ -1,43 +1,112 @@
-import logging
-import os
 import datetime
+import json
+import os
+from typing import Any, Dict
+
 from .console import ConsoleLogger
-from ..constants import ConsoleMode
-from ..settings import LOGGER_FILE_FOLDER, LOGGER_FILE_FILENAME
+from .writer import BufferedFileWriter
+from ..constants import ConsoleMode, LogFormat
+from ..distributed import is_main_process
+from ..events import RunnerForceStopEvent
+from ..loader import LoaderStartEvent
+from ..metric.metric_manager import MetricManagerFlushEvent
+from ..runner import RunnerEndEvent
+from ..state.events import CheckpointSavedEvent, CheckpointSavingEvent, CheckpointLoadedEvent, CheckpointLoadingEvent
+from ..settings import (
+    LOGGER_FILE_FOLDER,
+    LOGGER_FILE_FILENAME,
+    LOGGER_FILE_FORMAT,
+    LOGGER_FILE_FLUSH_INTERVAL,
+    LOGGER_FILE_BUFFER_SIZE
+)
 
 
 class FileLogger(ConsoleLogger):
+    # the file only gets records, the per-step handlers would run on every step for nothing
+    draws_progress = False
+
     def __init__(self,
                  folder: str = LOGGER_FILE_FOLDER,
                  filename: str = LOGGER_FILE_FILENAME,
+                 log_format: str = LOGGER_FILE_FORMAT,
+                 flush_interval: float = LOGGER_FILE_FLUSH_INTERVAL,
+                 buffer_size: int = LOGGER_FILE_BUFFER_SIZE,
                  ):
         super().__init__(mode=ConsoleMode.Basic)
 
+        if log_format not in (LogFormat.Text, LogFormat.JsonLines):
+            raise ValueError(f'unknown log_format={log_format}')
+
         self._folder = folder
         os.makedirs(self._folder, exist_ok=True)
 
         self._filename = filename
         self._logfile = os.path.join(self._folder, self._filename)
+        self._log_format = log_format
+
+        # one writer per instance, records are queued and written to the file in batches by its thread
+        self._writer = BufferedFileWriter(filepath=self._logfile,
+                                          flush_interval=flush_interval,
+                                          buffer_size=buffer_size)
+
+        self.sub(RunnerEndEvent, self.handle_runner_end)
+
+    def handle_runner_end(self, event: RunnerEndEvent):
+        self._writer.close()
+
+    def handle_runner_force_stop(self, event: RunnerForceStopEvent):
+        self._record("force_stop", f"runner.force_stop.reason={event.reason}", reason=event.reason)
+
+    def handle_loader_start(self, event: LoaderStartEvent):
+        # a file gets one record per flush or checkpoint event, not a progress line per loader
+        self._current_loader_name = event.loader.name
+
+    def handle_metric_manager_flush(self, event: MetricManagerFlushEvent):
+        super().handle_metric_manager_flush(event)
+
+        metrics = {metric: dict(epochs[self._current_epoch_index])
+                   for metric, epochs in event.metrics.items() if self._current_epoch_index in epochs}
+
+        self._record("metrics", self._current_text, metrics=metrics)
+
+    def handle_checkpoint_saving(self, event: CheckpointSavingEvent):
+        self._checkpoint_record("checkpoint_saving", event.checkpoint_type)
+
+    def handle_checkpoint_saved(self, event: CheckpointSavedEvent):
+        self._checkpoint_record("checkpoint_saved", event.checkpoint_type)
+
+    def handle_checkpoint_loading(self, event: CheckpointLoadingEvent):
+        self._checkpoint_record("checkpoint_loading", event.checkpoint_type)
+
+    def handle_checkpoint_loaded(self, event: CheckpointLoadedEvent):
+        self._checkpoint_record("checkpoint_loaded", event.checkpoint_type)
+
+    def _write_progress(self):
+        # progress lines are meant for terminals, the file only gets records
+        pass
 
-        self._logger = logging.getLogger(__name__)
-        self._logger.setLevel(logging.INFO)
+    def _checkpoint_record(self, kind: str, checkpoint_type: str):
+        self._record(kind, f"{kind}.{checkpoint_type}", checkpoint_type=checkpoint_type)
 
-        file_handler = logging.FileHandler(self._logfile)
-        file_handler.setLevel(logging.INFO)
+    def _record(self, kind: str, text: str, **fields: Any):
+        if not is_main_process():
+            return
 
-        self._logger.addHandler(file_handler)
+        timestamp = datetime.datetime.now(datetime.timezone.utc)
 
-    def _write_progress_bar(self,
-                            epoch_index: int,
-                            epochs_limit: int,
-                            loader_name: str,
-                            current_text: str,
-                            bar_length: int = 20):
-        epoch_str = f"epoch {epoch_index:0>3}/{epochs_limit:0>3} "
-        loader_str = f"({loader_name}) "
+        if self._log_format == LogFormat.JsonLines:
+            record: Dict[str, Any] = {
+                "time": timestamp.isoformat(),
+                "event": kind,
+                "epoch_index": self._current_epoch_index,
+                "epochs_limit": self._current_epochs_limit,
+                "loader_name": self._current_loader_name,
+            }
+            record.update(fields)
 
-        text = f"{datetime.datetime.utcnow()} {epoch_str}{loader_str} {current_text}"
-        self._write(text)
+            self._writer.write(f"{json.dumps(record)}\n")
+        else:
+            epoch_str = f"epoch {self._current_epoch_index:0>3}/{self._current_epochs_limit:0>3} "
+            loader_str = f"({self._current_loader_name}) "
 
-    def _write(self, text: str):
-        self._logger.info(text)
+            self._writer.write(f"{timestamp} {epoch_str}{loader_str} {text}\n")
@@ -0,0 +1,64 @@
+import queue
+import threading
+import time
+from typing import List, Optional
+
+
+class BufferedFileWriter:
+    _close = object()
+
+    def __init__(self, filepath: str, flush_interval: float, buffer_size: int):
+        self._filepath = filepath
+        self._flush_interval = flush_interval
+        self._buffer_size = buffer_size
+
+        self._queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self, line: str):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="convolut-file-logger", daemon=True)
+            self._thread.start()
+
+        self._queue.put(line)
+
+    def close(self):
+        if self._thread is None:
+            return
+
+        self._queue.put(self._close)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        buffer: List[str] = []
+
+        # lines are written in batches, the file is flushed once per interval instead of once per line
+        with open(self._filepath, "a", encoding="utf-8") as file:
+            deadline = time.monotonic() + self._flush_interval
+
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    item = None
+
+                if item is self._close:
+                    break
+
+                if item is not None:
+                    buffer.append(item)
+
+                expired = time.monotonic() >= deadline
+
+                if buffer and (expired or len(buffer) >= self._buffer_size):
+                    file.write("".join(buffer))
+                    file.flush()
+                    buffer = []
+
+                if expired:
+                    deadline = time.monotonic() + self._flush_interval
+
+            if buffer:
+                file.write("".join(buffer))
+                file.flush()
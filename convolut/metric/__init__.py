@@ -1,6 +1,16 @@
+from .confusion import ConfusionMatrixMetric
 from .dice import DiceMetric
-from .events import MetricEvent
+from .events import MetricEvent, MemoryThresholdEvent
 from .loss import LossMetric
 from .metric_manager import FlushType, MetricManager, MetricManagerFlushEvent
+from .reducer import (
+    Reducer, MeanReducer, SumReducer, MinReducer, MaxReducer, LastReducer, EmaReducer, VarianceReducer
+)
+from .memory import MemoryMetric
+from .sampling import SamplingPolicy
+from .timing import TimingMetric
 
-__all__ = ["FlushType", "MetricManager", "MetricEvent", "DiceMetric", "MetricManagerFlushEvent"]
+__all__ = ["FlushType", "MetricManager", "MetricEvent", "DiceMetric", "MetricManagerFlushEvent", "Reducer",
+           "MeanReducer", "SumReducer", "MinReducer", "MaxReducer", "LastReducer", "EmaReducer", "VarianceReducer",
+           "ConfusionMatrixMetric", "MemoryMetric", "MemoryThresholdEvent", "SamplingPolicy",
+           "TimingMetric"]
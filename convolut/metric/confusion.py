@@ -0,0 +1,197 @@
+from typing import Dict, Optional
+
+import torch
+import torch.distributed as dist
+from decouple import Module
+
+from .events import MetricEvent
+from .sampling import SamplingPolicy
+from ..distributed import is_distributed
+from ..events import StateCollectEvent, StateRestoreEvent
+from ..loader import LoaderStartEvent, LoaderEndEvent
+from ..model import ModelLossStartEvent
+from ..settings import (
+    METRIC_CONFUSION_NUM_CLASSES,
+    METRIC_CONFUSION_THRESHOLD,
+    METRIC_CONFUSION_IGNORE_INDEX,
+    METRIC_CONFUSION_PREFIX,
+    METRIC_CONFUSION_PER_CLASS
+)
+
+
+class ConfusionMatrixMetric(Module):
+    def __init__(self,
+                 num_classes: Optional[int] = METRIC_CONFUSION_NUM_CLASSES,
+                 threshold: float = METRIC_CONFUSION_THRESHOLD,
+                 ignore_index: Optional[int] = METRIC_CONFUSION_IGNORE_INDEX,
+                 prefix: str = METRIC_CONFUSION_PREFIX,
+                 per_class: bool = METRIC_CONFUSION_PER_CLASS,
+                 sampling: Optional[SamplingPolicy] = None,
+                 ):
+        super().__init__()
+
+        # None takes the number of output channels, a single channel is a binary problem
+        self._num_classes = num_classes
+        # applied to the sigmoid of single channel outputs, multi channel outputs use the argmax
+        self._threshold = threshold
+        self._ignore_index = ignore_index
+        self._prefix = prefix
+        self._per_class = per_class
+        self._sampling = sampling if sampling else SamplingPolicy()
+
+        # target x prediction counts of the current loader, kept on the output's device until the loader ends
+        self._matrix: Optional[torch.Tensor] = None
+        self._loader_name: Optional[str] = None
+        self._epoch_index: Optional[int] = None
+        self._step_index: Optional[int] = None
+        self._batch_index: Optional[int] = None
+
+        (
+            self.sub(LoaderStartEvent, self.handle_loader_start)
+                .sub(LoaderEndEvent, self.handle_loader_end)
+                .sub(ModelLossStartEvent, self.handle_loss_start)
+                .sub(StateCollectEvent, self.handle_state_collect)
+                .sub(StateRestoreEvent, self.handle_state_restore)
+        )
+
+    def handle_loader_start(self, event: LoaderStartEvent):
+        # a loader resumed in the middle keeps the counts restored from the checkpoint
+        if self._loader_name != event.loader.name or self._epoch_index != event.epoch_index:
+            self._matrix = None
+
+        self._loader_name = event.loader.name
+        self._epoch_index = event.epoch_index
+
+        self._sampling.start(event.loader.name, event.loader.expected_steps())
+
+    def handle_loss_start(self, event: ModelLossStartEvent):
+        if not self._sampling.sample(event.loader_name, event.epoch_index, event.step_index):
+            return
+
+        self._step_index = event.step_index
+        self._batch_index = event.batch_index
+
+        output = event.output.detach()
+        target = event.target.detach()
+
+        num_classes = self._num_classes or max(2, output.size(1))
+
+        if output.size(1) > 1 and output.size(1) > num_classes:
+            # an argmax over more channels than classes would land in the cells of the next row
+            raise ValueError(f"output has {output.size(1)} channels but num_classes={num_classes}")
+
+        if output.size(1) == 1:
+            prediction = (torch.sigmoid(output) > self._threshold).long()
+            target = (target > 0.5).long() if target.is_floating_point() else target.long()
+        else:
+            prediction = torch.argmax(output, dim=1)
+            # one-hot targets or class indices with or without the channel dimension
+            if target.shape == output.shape:
+                target = torch.argmax(target, dim=1)
+            elif target.dim() == output.dim():
+                target = target.squeeze(1)
+
+            target = target.long()
+
+        target = target.reshape(-1)
+        prediction = prediction.reshape(-1)
+
+        if self._ignore_index is not None:
+            keep = target != self._ignore_index
+            target = target[keep]
+            prediction = prediction[keep]
+
+        # a label outside of the matrix would be dropped (too large) or make bincount fail (negative)
+        if bool(((target < 0) | (target >= num_classes)).any()):
+            raise ValueError(f"target labels must be in [0, {num_classes}), "
+                             f"labels to leave out are set through ignore_index={self._ignore_index}")
+
+        # a single bincount per batch, cell (t, p) of the matrix sits at t * num_classes + p
+        counts = torch.bincount(target * num_classes + prediction, minlength=num_classes * num_classes)
+
+        if self._matrix is None:
+            self._matrix = torch.zeros(num_classes * num_classes, dtype=torch.long, device=counts.device)
+        elif self._matrix.device != counts.device:
+            # counts restored from a checkpoint are on the cpu
+            self._matrix = self._matrix.to(counts.device)
+
+        self._matrix += counts
+
+    def handle_loader_end(self, event: LoaderEndEvent):
+        if self._matrix is None:
+            return
+
+        matrix = self._matrix.clone()
+
+        # counts add up exactly across processes, every process then derives the same values
+        if is_distributed():
+            dist.all_reduce(matrix)
+
+        num_classes = int(round(matrix.numel() ** 0.5))
+        matrix = matrix.view(num_classes, num_classes).double()
+
+        for metric_name, metric_value in self._derive(matrix).items():
+            self._publish(metric_name, metric_value)
+
+        self._matrix = None
+
+    def handle_state_collect(self, event: StateCollectEvent):
+        if self._matrix is not None:
+            event.state[f"confusion_matrix.{self._prefix}"] = {
+                "matrix": self._matrix.cpu(),
+                "loader_name": self._loader_name,
+                "epoch_index": self._epoch_index,
+            }
+
+    def handle_state_restore(self, event: StateRestoreEvent):
+        state = event.state.get(f"confusion_matrix.{self._prefix}")
+
+        if state is not None:
+            self._matrix = state["matrix"]
+            self._loader_name = state["loader_name"]
+            self._epoch_index = state["epoch_index"]
+
+    def _derive(self, matrix: torch.Tensor) -> Dict[str, float]:
+        true_positive = torch.diagonal(matrix)
+        false_positive = torch.sum(matrix, dim=0) - true_positive
+        false_negative = torch.sum(matrix, dim=1) - true_positive
+
+        per_class = {
+            "precision": _divide(true_positive, true_positive + false_positive),
+            "recall": _divide(true_positive, true_positive + false_negative),
+            "f1": _divide(2 * true_positive, 2 * true_positive + false_positive + false_negative),
+            "iou": _divide(true_positive, true_positive + false_positive + false_negative),
+        }
+        # dataset level dice is f1 over the accumulated counts, kept under its segmentation name
+        per_class["dice"] = per_class["f1"]
+
+        metrics = {"accuracy": float(torch.sum(true_positive) / torch.sum(matrix).clamp(min=1))}
+
+        for name, values in per_class.items():
+            if matrix.size(0) == 2:
+                # binary problems report the positive class, as the dice of a single channel output does
+                metrics[name] = float(values[1])
+            else:
+                # classes absent from both the target and the prediction are left out of the mean
+                present = values[~torch.isnan(values)]
+                metrics[name] = float(present.mean()) if present.numel() > 0 else float("nan")
+
+            if self._per_class:
+                for class_index, value in enumerate(values.tolist()):
+                    metrics[f"{name}.class_{class_index}"] = value
+
+        return metrics
+
+    def _publish(self, metric_name: str, metric_value: float):
+        self.pub(MetricEvent(metric_name=f"{self._prefix}.{metric_name}",
+                             metric_value=metric_value,
+                             periods={
+                                 "loader_name": self._loader_name,
+                                 "epoch_index": self._epoch_index,
+                                 "step_index": self._step_index,
+                                 "batch_index": self._batch_index,
+                             }))
+
+
+def _divide(numerator: torch.Tensor, denominator: torch.Tensor) -> torch.Tensor:
+    return torch.where(denominator > 0, numerator / denominator.clamp(min=1), torch.full_like(numerator, float("nan")))
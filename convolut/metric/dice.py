@@ -1,21 +1,70 @@
+from typing import Callable, Optional, Union
+
+import torch
 from decouple import Module
 
 from .events import MetricEvent
+from .sampling import SamplingPolicy
+from ..constants import DiceReduction
+from ..loader import LoaderStartEvent
 from ..model import ModelLossStartEvent
-from ..utils.dice import dice
+from ..utils.dice import dice_stats, reduce_dice
+from ..settings import METRIC_DICE_THRESHOLD, METRIC_DICE_ACTIVATION, METRIC_DICE_REDUCTION, METRIC_DICE_PER_CLASS
 
 
 class DiceMetric(Module):
-    def __init__(self):
+    def __init__(self,
+                 threshold: Optional[float] = METRIC_DICE_THRESHOLD,
+                 activation: Optional[Union[str, Callable]] = METRIC_DICE_ACTIVATION,
+                 reduction: str = METRIC_DICE_REDUCTION,
+                 per_class: bool = METRIC_DICE_PER_CLASS,
+                 weights: Optional[torch.Tensor] = None,
+                 sampling: Optional[SamplingPolicy] = None,
+                 ):
         super().__init__()
 
-        self.sub(ModelLossStartEvent, self.dice)
+        self._threshold = threshold
+        self._activation = activation
+        self._reduction = reduction
+        self._per_class = per_class
+        self._weights = weights
+        self._sampling = sampling if sampling else SamplingPolicy()
+
+        (
+            self.sub(LoaderStartEvent, self.handle_loader_start)
+                .sub(ModelLossStartEvent, self.dice)
+        )
+
+    def handle_loader_start(self, event: LoaderStartEvent):
+        self._sampling.start(event.loader.name, event.loader.expected_steps())
 
     def dice(self, event: ModelLossStartEvent):
-        metric_value = dice(event.output, event.target)
+        if not self._sampling.sample(event.loader_name, event.epoch_index, event.step_index):
+            return
+
+        # one pass over the batch, every reduction is derived from the same [batch, classes] sums
+        stats = dice_stats(event.output.detach(), event.target, self._threshold, self._activation)
+
+        metric_value = reduce_dice(*stats, reduction=self._reduction, weights=self._weights)
+        if self._reduction == DiceReduction.NoReduction:
+            metric_value = torch.mean(metric_value)
+
+        # the batch score stands for every sample of the batch
+        weight = event.batch_size or 1
+
+        self._publish(event, "dice", metric_value, weight)
+
+        if self._per_class:
+            per_class = reduce_dice(*(torch.sum(stat, dim=0, keepdim=True) for stat in stats),
+                                    reduction=DiceReduction.NoReduction)[0]
+
+            for class_index in range(per_class.size(0)):
+                self._publish(event, f"dice.class_{class_index}", per_class[class_index], weight)
 
-        self.pub(MetricEvent(metric_name="dice",
+    def _publish(self, event: ModelLossStartEvent, metric_name: str, metric_value: torch.Tensor, weight: int):
+        self.pub(MetricEvent(metric_name=metric_name,
                              metric_value=metric_value,
+                             weight=weight,
                              periods={
                                  "loader_name": event.loader_name,
                                  "epoch_index": event.epoch_index,
@@ -1,12 +1,28 @@
 from dataclasses import dataclass
-from typing import Dict, Union
+from typing import Dict, Optional, Union
 
+import torch
 from decouple import Event
 
 
 @dataclass
 class MetricEvent(Event):
     metric_name: str = None
-    metric_value: float = None
+    metric_value: Union[float, torch.Tensor] = None
+    # number of samples the value stands for, means and sums are weighted by it
+    weight: Union[float, torch.Tensor] = 1.0
 
     periods: Dict[str, Union[str, int]] = None
+
+
+# published when a sampled memory stat rises above its threshold, again only after it has dropped below it
+@dataclass
+class MemoryThresholdEvent(Event):
+    stat: str = None
+    phase: str = None
+    value_mb: float = None
+    threshold_mb: float = None
+
+    loader_name: Optional[str] = None
+    epoch_index: Optional[int] = None
+    step_index: Optional[int] = None
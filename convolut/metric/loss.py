@@ -1,20 +1,36 @@
+from typing import Optional
+
 from decouple import Module
 
 from .events import MetricEvent
+from .sampling import SamplingPolicy
+from ..loader import LoaderStartEvent
 from ..model import ModelLossEndEvent
 
 
 class LossMetric(Module):
-    def __init__(self):
+    def __init__(self, sampling: Optional[SamplingPolicy] = None):
         super().__init__()
 
-        self.sub(ModelLossEndEvent, self.loss)
+        self._sampling = sampling if sampling else SamplingPolicy()
+
+        (
+            self.sub(LoaderStartEvent, self.handle_loader_start)
+                .sub(ModelLossEndEvent, self.loss)
+        )
+
+    def handle_loader_start(self, event: LoaderStartEvent):
+        self._sampling.start(event.loader.name, event.loader.expected_steps())
 
     def loss(self, event: ModelLossEndEvent):
-        metric_value = event.loss.item()
+        if not self._sampling.sample(event.loader_name, event.epoch_index, event.step_index):
+            return
+
+        metric_value = event.loss.detach()
 
         self.pub(MetricEvent(metric_name="loss",
                              metric_value=metric_value,
+                             weight=event.batch_size or 1,
                              periods={
                                  "loader_name": event.loader_name,
                                  "epoch_index": event.epoch_index,
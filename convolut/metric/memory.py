@@ -0,0 +1,188 @@
+import os
+import sys
+import tracemalloc
+from typing import Dict, Optional, Tuple
+
+import torch
+from decouple import Module
+
+from .events import MetricEvent, MemoryThresholdEvent
+from ..epoch import EpochStartEvent
+from ..loader import LoaderStartEvent, LoaderEndEvent, LoaderProcessBatchStartEvent, LoaderProcessBatchEndEvent
+from ..model import ModelForwardEndEvent, ModelBackwardEndEvent
+from ..runner import RunnerStartEvent, RunnerEndEvent
+from ..settings import (
+    METRIC_MEMORY_EVERY_STEPS,
+    METRIC_MEMORY_TRACEMALLOC,
+    METRIC_MEMORY_THRESHOLD_MB,
+    METRIC_MEMORY_THRESHOLD_STAT
+)
+
+_MB = 1024 * 1024
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "rb") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # only the peak is available here, kilobytes on linux and bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryMetric(Module):
+    def __init__(self,
+                 every_steps: int = METRIC_MEMORY_EVERY_STEPS,
+                 trace_python: bool = METRIC_MEMORY_TRACEMALLOC,
+                 threshold_mb: Optional[float] = METRIC_MEMORY_THRESHOLD_MB,
+                 threshold_stat: str = METRIC_MEMORY_THRESHOLD_STAT,
+                 ):
+        super().__init__()
+
+        self._every_steps = max(1, every_steps)
+        # tracemalloc slows down every python allocation, it is opt-in
+        self._trace_python = trace_python
+        self._owns_tracemalloc = False
+
+        self._threshold_mb = threshold_mb
+        self._threshold_stat = threshold_stat
+        self._above_threshold = False
+
+        self._cuda = torch.cuda.is_available()
+
+        self._loader_name: Optional[str] = None
+        self._epoch_index: Optional[int] = None
+        self._step_index: Optional[int] = None
+        self._batch_index: Optional[int] = None
+        self._sampling = False
+
+        # (stat, phase) -> the largest value sampled during the loader, in megabytes
+        self._maximums: Dict[Tuple[str, str], float] = {}
+
+        (
+            self.sub(RunnerStartEvent, self.handle_runner_start)
+                .sub(RunnerEndEvent, self.handle_runner_end)
+                .sub(EpochStartEvent, self.handle_epoch_start)
+                .sub(LoaderStartEvent, self.handle_loader_start)
+                .sub(LoaderEndEvent, self.handle_loader_end)
+                .sub(LoaderProcessBatchStartEvent, self.handle_process_batch_start)
+                .sub(LoaderProcessBatchEndEvent, self.handle_process_batch_end)
+                .sub(ModelForwardEndEvent, self.handle_forward_end)
+                .sub(ModelBackwardEndEvent, self.handle_backward_end)
+        )
+
+    def handle_runner_start(self, event: RunnerStartEvent):
+        if self._trace_python and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+
+    def handle_runner_end(self, event: RunnerEndEvent):
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+
+    def handle_epoch_start(self, event: EpochStartEvent):
+        # peaks are reported per epoch
+        if self._cuda:
+            torch.cuda.reset_peak_memory_stats()
+
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def handle_loader_start(self, event: LoaderStartEvent):
+        self._loader_name = event.loader.name
+        self._epoch_index = event.epoch_index
+        self._maximums = {}
+
+    def handle_process_batch_start(self, event: LoaderProcessBatchStartEvent):
+        self._step_index = event.step_index
+        self._batch_index = event.batch_index
+        self._sampling = event.step_index % self._every_steps == 0
+
+        if self._sampling:
+            self._sample("data")
+
+    def handle_forward_end(self, event: ModelForwardEndEvent):
+        if self._sampling:
+            self._sample("forward")
+
+    def handle_backward_end(self, event: ModelBackwardEndEvent):
+        if self._sampling:
+            self._sample("backward")
+
+    def handle_process_batch_end(self, event: LoaderProcessBatchEndEvent):
+        if self._sampling:
+            self._sample("step")
+
+        self._sampling = False
+
+    def handle_loader_end(self, event: LoaderEndEvent):
+        self._sample("end")
+
+        for (stat, phase), value in self._maximums.items():
+            self._publish(f"memory_mb.{stat}.{phase}", value)
+
+        # allocator peaks since the epoch start, they also catch what happens between the samples
+        if self._cuda:
+            self._publish("memory_mb.allocated.peak", torch.cuda.max_memory_allocated() / _MB)
+            self._publish("memory_mb.reserved.peak", torch.cuda.max_memory_reserved() / _MB)
+
+        if tracemalloc.is_tracing():
+            self._publish("memory_mb.traced.peak", tracemalloc.get_traced_memory()[1] / _MB)
+
+    def _sample(self, phase: str):
+        stats: Dict[str, float] = {}
+
+        rss = _rss_bytes()
+        if rss is not None:
+            stats["rss"] = rss / _MB
+
+        if self._cuda:
+            stats["allocated"] = torch.cuda.memory_allocated() / _MB
+            stats["reserved"] = torch.cuda.memory_reserved() / _MB
+
+        if tracemalloc.is_tracing():
+            stats["traced"] = tracemalloc.get_traced_memory()[0] / _MB
+
+        for stat, value in stats.items():
+            key = (stat, phase)
+            if value > self._maximums.get(key, -1.0):
+                self._maximums[key] = value
+
+        if self._threshold_mb is not None and self._threshold_stat in stats:
+            self._check_threshold(phase, stats[self._threshold_stat])
+
+    def _check_threshold(self, phase: str, value: float):
+        if value < self._threshold_mb:
+            self._above_threshold = False
+            return
+
+        if self._above_threshold:
+            return
+
+        self._above_threshold = True
+        self.pub(MemoryThresholdEvent(stat=self._threshold_stat,
+                                      phase=phase,
+                                      value_mb=value,
+                                      threshold_mb=self._threshold_mb,
+                                      loader_name=self._loader_name,
+                                      epoch_index=self._epoch_index,
+                                      step_index=self._step_index))
+
+    def _publish(self, metric_name: str, metric_value: float):
+        self.pub(MetricEvent(metric_name=metric_name,
+                             metric_value=metric_value,
+                             periods={
+                                 "loader_name": self._loader_name,
+                                 "epoch_index": self._epoch_index,
+                                 "step_index": self._step_index,
+                                 "batch_index": self._batch_index,
+                             }))
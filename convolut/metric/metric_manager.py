@@ -1,27 +1,44 @@
 from dataclasses import dataclass
-from statistics import mean
-from typing import Dict, List
+from typing import Callable, Dict, Optional, Set, Tuple, Union
 
+import torch
 from decouple import Module, Event
 
 from ..constants import FlushType
 from .events import MetricEvent
+from .reducer import Reducer, create_reducer
+from ..distributed import all_gather_object, is_distributed
 from ..epoch import EpochEndEvent
+from ..events import StateCollectEvent, StateRestoreEvent
 from ..loader import LoaderEndEvent
-from ..settings import METRIC_MANAGER_FLUSH_TYPE
+from ..settings import METRIC_MANAGER_FLUSH_TYPE, METRIC_MANAGER_REDUCE_TYPE
 
 
 class MetricManager(Module):
     def __init__(self,
-                 flush_type: str = METRIC_MANAGER_FLUSH_TYPE
+                 flush_type: str = METRIC_MANAGER_FLUSH_TYPE,
+                 reduce_type: str = METRIC_MANAGER_REDUCE_TYPE,
+                 reducers: Optional[Dict[str, Callable[[], Reducer]]] = None,
                  ):
         super().__init__()
 
         self._flush_type = flush_type
-        self._raw: Dict[str, Dict[int, Dict[str, List[float]]]] = {}
+        self._reduce_type = reduce_type
+        self._reducers = reducers if reducers else {}
+
+        # constant-size streaming state per metric->epoch_index->loader_name
+        self._raw: Dict[str, Dict[int, Dict[str, Reducer]]] = {}
+        self._touched: Set[Tuple[str, int, str]] = set()
         self._metrics: Dict[str, Dict[int, Dict[str, float]]] = {}
+        # total weight, the number of samples, every aggregate is reduced from
+        self._local_counts: Dict[Tuple[str, int, str], Union[float, torch.Tensor]] = {}
+        self._counts: Dict[str, Dict[int, Dict[str, float]]] = {}
 
-        self.sub(MetricEvent, self.handle_metric)
+        (
+            self.sub(MetricEvent, self.handle_metric)
+                .sub(StateCollectEvent, self.handle_state_collect)
+                .sub(StateRestoreEvent, self.handle_state_restore)
+        )
 
         if self._flush_type == FlushType.PerEpoch:
             self.sub(EpochEndEvent, self._flush_per_epoch)
@@ -35,51 +52,125 @@ class MetricManager(Module):
 
         metrics = self._aggregate(epoch_index)
 
-        self.pub(MetricManagerFlushEvent(metrics=metrics))
+        self.pub(MetricManagerFlushEvent(metrics=metrics, counts=self._counts))
 
     def _flush_per_loader(self, event: LoaderEndEvent):
         epoch_index = event.epoch_index
 
         metrics = self._aggregate(epoch_index)
 
-        self.pub(MetricManagerFlushEvent(metrics=metrics))
+        self.pub(MetricManagerFlushEvent(metrics=metrics, counts=self._counts))
 
     def _aggregate(self, epoch: int) -> Dict[str, Dict[int, Dict[str, float]]]:
-        for metric in self._raw.keys():
+        if is_distributed():
+            values, counts = self._gather()
+        else:
+            # only keys updated since the previous flush are reduced again
+            values = {key: self._reducer(*key).value() for key in self._touched}
+            counts = {key: float(self._local_counts[key]) for key in self._touched}
+
+        for (metric, epoch_index, loader), value in values.items():
             if metric not in self._metrics:
                 self._metrics[metric] = {}
+                self._counts[metric] = {}
 
-            for epoch, loaders in self._raw[metric].items():
-                if epoch not in self._metrics[metric]:
-                    self._metrics[metric][epoch] = {}
+            if epoch_index not in self._metrics[metric]:
+                self._metrics[metric][epoch_index] = {}
+                self._counts[metric][epoch_index] = {}
 
-                for loader, values in loaders.items():
-                    if loader not in self._metrics[metric][epoch]:
-                        self._metrics[metric][epoch][loader] = mean(values)
+            self._metrics[metric][epoch_index][loader] = value
+            self._counts[metric][epoch_index][loader] = counts[(metric, epoch_index, loader)]
+
+        self._touched = set()
 
         return self._metrics
 
+    def _gather(self) -> Tuple[Dict[Tuple[str, int, str], float], Dict[Tuple[str, int, str], float]]:
+        # a single collective exchanges the states of every touched key between all processes
+        states = {key: (self._reducer(*key).state(), float(self._local_counts[key])) for key in self._touched}
+        gathered = all_gather_object(states)
+
+        keys = set()
+        for process_states in gathered:
+            keys.update(process_states.keys())
+
+        values = {}
+        counts = {}
+        for key in keys:
+            key_states = [process_states[key] for process_states in gathered if key in process_states]
+            values[key] = self._reducer(*key).merge([state for state, _ in key_states])
+            counts[key] = sum(count for _, count in key_states)
+
+        return values, counts
+
+    def _reducer(self, metric_name: str, epoch_index: int, loader_name: str) -> Reducer:
+        if metric_name not in self._raw:
+            self._raw[metric_name] = {}
+
+        if epoch_index not in self._raw[metric_name]:
+            self._raw[metric_name][epoch_index] = {}
+
+        if loader_name not in self._raw[metric_name][epoch_index]:
+            if metric_name in self._reducers:
+                reducer = self._reducers[metric_name]()
+            else:
+                reducer = create_reducer(self._reduce_type)
+
+            self._raw[metric_name][epoch_index][loader_name] = reducer
+
+        return self._raw[metric_name][epoch_index][loader_name]
+
+    def handle_state_collect(self, event: StateCollectEvent):
+        event.state["metric_manager"] = {
+            "raw": {(metric, epoch_index, loader): reducer.state()
+                    for metric, epochs in self._raw.items()
+                    for epoch_index, loaders in epochs.items()
+                    for loader, reducer in loaders.items()},
+            "touched": list(self._touched),
+            "metrics": self._metrics,
+            "local_counts": {key: float(count) for key, count in self._local_counts.items()},
+            "counts": self._counts,
+        }
+
+    def handle_state_restore(self, event: StateRestoreEvent):
+        if "metric_manager" not in event.state:
+            return
+
+        state = event.state["metric_manager"]
+
+        self._raw = {}
+        for key, reducer_state in state["raw"].items():
+            self._reducer(*key).load_state(reducer_state)
+
+        self._touched = {tuple(key) for key in state["touched"]}
+        self._metrics = state["metrics"]
+        self._local_counts = state.get("local_counts", {})
+        self._counts = state.get("counts", {})
+
     def handle_metric(self, event: MetricEvent):
         metric_name = event.metric_name
         metric_value = event.metric_value
+        weight = event.weight
 
         epoch_index = event.periods["epoch_index"]
         loader_name = event.periods["loader_name"]
         step_index = event.periods["step_index"]  # todo
         batch_index = event.periods["batch_index"]  # todo
 
-        if metric_name not in self._raw:
-            self._raw[metric_name] = {}
+        if isinstance(metric_value, torch.Tensor):
+            metric_value = metric_value.detach()
 
-        if epoch_index not in self._raw[metric_name]:
-            self._raw[metric_name][epoch_index] = {}
+        if isinstance(weight, torch.Tensor):
+            weight = weight.detach()
 
-        if loader_name not in self._raw[metric_name][epoch_index]:
-            self._raw[metric_name][epoch_index][loader_name] = []
+        key = (metric_name, epoch_index, loader_name)
 
-        self._raw[metric_name][epoch_index][loader_name].append(metric_value)
+        self._reducer(*key).update(metric_value, weight)
+        self._touched.add(key)
+        self._local_counts[key] = self._local_counts.get(key, 0) + weight
 
 
 @dataclass
 class MetricManagerFlushEvent(Event):
     metrics: Dict[str, Dict[int, Dict[str, float]]] = None  # metric_name->epoch_index->loader_name,value
+    counts: Dict[str, Dict[int, Dict[str, float]]] = None  # metric_name->epoch_index->loader_name,weight
@@ -0,0 +1,238 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Tuple, Union
+
+import torch
+
+from ..constants import ReduceType
+from ..settings import METRIC_MANAGER_EMA_ALPHA
+
+Value = Union[float, torch.Tensor]
+
+
+def _item(value: Value) -> float:
+    return None if value is None else float(value)
+
+
+class Reducer(ABC):
+    # weight is the number of samples a value stands for, reducers without a weighted form ignore it
+    @abstractmethod
+    def update(self, value: Value, weight: Value = 1.0):
+        pass
+
+    @abstractmethod
+    def value(self) -> float:
+        pass
+
+    # host-side snapshot that can be exchanged between processes and merged without touching local state
+    @abstractmethod
+    def state(self) -> Tuple:
+        pass
+
+    @abstractmethod
+    def merge(self, states: List[Tuple]) -> float:
+        pass
+
+    @abstractmethod
+    def load_state(self, state: Tuple):
+        pass
+
+
+class MeanReducer(Reducer):
+    def __init__(self):
+        self._total: Value = 0.0
+        self._count: Value = 0
+
+    def update(self, value: Value, weight: Value = 1.0):
+        self._total = self._total + value * weight
+        self._count = self._count + weight
+
+    def value(self) -> float:
+        return float(self._total) / float(self._count)
+
+    def state(self) -> Tuple:
+        return float(self._total), float(self._count)
+
+    def merge(self, states: List[Tuple]) -> float:
+        return sum(total for total, _ in states) / sum(count for _, count in states)
+
+    def load_state(self, state: Tuple):
+        self._total, self._count = state
+
+
+class SumReducer(Reducer):
+    def __init__(self):
+        self._total: Value = 0.0
+
+    def update(self, value: Value, weight: Value = 1.0):
+        self._total = self._total + value * weight
+
+    def value(self) -> float:
+        return float(self._total)
+
+    def state(self) -> Tuple:
+        return float(self._total),
+
+    def merge(self, states: List[Tuple]) -> float:
+        return sum(total for total, in states)
+
+    def load_state(self, state: Tuple):
+        self._total, = state
+
+
+class MinReducer(Reducer):
+    def __init__(self):
+        self._value: Value = None
+
+    def update(self, value: Value, weight: Value = 1.0):
+        if self._value is None:
+            self._value = value
+        elif isinstance(value, torch.Tensor) or isinstance(self._value, torch.Tensor):
+            # comparing tensors in python would force a device sync
+            self._value = torch.minimum(torch.as_tensor(self._value), torch.as_tensor(value))
+        else:
+            self._value = min(self._value, value)
+
+    def value(self) -> float:
+        return float(self._value)
+
+    def state(self) -> Tuple:
+        return _item(self._value),
+
+    def merge(self, states: List[Tuple]) -> float:
+        return min(value for value, in states if value is not None)
+
+    def load_state(self, state: Tuple):
+        self._value, = state
+
+
+class MaxReducer(Reducer):
+    def __init__(self):
+        self._value: Value = None
+
+    def update(self, value: Value, weight: Value = 1.0):
+        if self._value is None:
+            self._value = value
+        elif isinstance(value, torch.Tensor) or isinstance(self._value, torch.Tensor):
+            self._value = torch.maximum(torch.as_tensor(self._value), torch.as_tensor(value))
+        else:
+            self._value = max(self._value, value)
+
+    def value(self) -> float:
+        return float(self._value)
+
+    def state(self) -> Tuple:
+        return _item(self._value),
+
+    def merge(self, states: List[Tuple]) -> float:
+        return max(value for value, in states if value is not None)
+
+    def load_state(self, state: Tuple):
+        self._value, = state
+
+
+class LastReducer(Reducer):
+    def __init__(self):
+        self._value: Value = None
+
+    def update(self, value: Value, weight: Value = 1.0):
+        self._value = value
+
+    def value(self) -> float:
+        return float(self._value)
+
+    def state(self) -> Tuple:
+        return _item(self._value),
+
+    def merge(self, states: List[Tuple]) -> float:
+        values = [value for value, in states if value is not None]
+        return sum(values) / len(values)
+
+    def load_state(self, state: Tuple):
+        self._value, = state
+
+
+class EmaReducer(Reducer):
+    def __init__(self, alpha: float = METRIC_MANAGER_EMA_ALPHA):
+        self._alpha = alpha
+        self._value: Value = None
+
+    def update(self, value: Value, weight: Value = 1.0):
+        if self._value is None:
+            self._value = value
+        else:
+            self._value = self._alpha * value + (1 - self._alpha) * self._value
+
+    def value(self) -> float:
+        return float(self._value)
+
+    def state(self) -> Tuple:
+        return _item(self._value),
+
+    def merge(self, states: List[Tuple]) -> float:
+        values = [value for value, in states if value is not None]
+        return sum(values) / len(values)
+
+    def load_state(self, state: Tuple):
+        self._value, = state
+
+
+class VarianceReducer(Reducer):
+    # Welford's online algorithm with frequency weights (West), returns the sample variance
+    def __init__(self):
+        self._count: Value = 0
+        self._mean: Value = 0.0
+        self._m2: Value = 0.0
+
+    def update(self, value: Value, weight: Value = 1.0):
+        self._count = self._count + weight
+        delta = value - self._mean
+        self._mean = self._mean + delta * weight / self._count
+        self._m2 = self._m2 + weight * delta * (value - self._mean)
+
+    def value(self) -> float:
+        if float(self._count) < 2:
+            return 0.0
+
+        return float(self._m2) / (float(self._count) - 1)
+
+    def state(self) -> Tuple:
+        return float(self._count), float(self._mean), float(self._m2)
+
+    def merge(self, states: List[Tuple]) -> float:
+        # Chan et al. pairwise combination of per-process Welford states
+        count, mean, m2 = 0, 0.0, 0.0
+        for other_count, other_mean, other_m2 in states:
+            if other_count == 0:
+                continue
+
+            total = count + other_count
+            delta = other_mean - mean
+            mean = mean + delta * other_count / total
+            m2 = m2 + other_m2 + delta * delta * count * other_count / total
+            count = total
+
+        if count < 2:
+            return 0.0
+
+        return m2 / (count - 1)
+
+    def load_state(self, state: Tuple):
+        self._count, self._mean, self._m2 = state
+
+
+REDUCERS: Dict[str, Callable[[], Reducer]] = {
+    ReduceType.Mean: MeanReducer,
+    ReduceType.Sum: SumReducer,
+    ReduceType.Min: MinReducer,
+    ReduceType.Max: MaxReducer,
+    ReduceType.Last: LastReducer,
+    ReduceType.Ema: EmaReducer,
+    ReduceType.Variance: VarianceReducer,
+}
+
+
+def create_reducer(reduce_type: str) -> Reducer:
+    if reduce_type not in REDUCERS:
+        raise ValueError(f'unknown reduce_type:{reduce_type}')
+
+    return REDUCERS[reduce_type]()
@@ -0,0 +1,51 @@
+import zlib
+from typing import Dict, List, Optional
+
+from ..settings import (
+    METRIC_SAMPLING_EVERY_N_STEPS,
+    METRIC_SAMPLING_FRACTION,
+    METRIC_SAMPLING_LOADER_NAMES,
+    METRIC_SAMPLING_LAST_K_STEPS,
+    METRIC_SAMPLING_SEED
+)
+
+
+class SamplingPolicy:
+    def __init__(self,
+                 every_n_steps: int = METRIC_SAMPLING_EVERY_N_STEPS,
+                 fraction: float = METRIC_SAMPLING_FRACTION,
+                 loader_names: Optional[List[str]] = METRIC_SAMPLING_LOADER_NAMES,
+                 last_k_steps: int = METRIC_SAMPLING_LAST_K_STEPS,
+                 seed: int = METRIC_SAMPLING_SEED,
+                 ):
+        self._every_n_steps = max(1, every_n_steps)
+        self._fraction = fraction
+        # None evaluates every loader
+        self._loader_names = loader_names
+        # 0 evaluates the whole epoch, loaders of unknown length are always evaluated in full
+        self._last_k_steps = last_k_steps
+        self._seed = seed
+
+        self._steps: Dict[str, Optional[int]] = {}
+
+    def start(self, loader_name: str, steps: Optional[int]):
+        self._steps[loader_name] = steps
+
+    def sample(self, loader_name: str, epoch_index: int, step_index: int) -> bool:
+        if self._loader_names is not None and loader_name not in self._loader_names:
+            return False
+
+        if step_index % self._every_n_steps != 0:
+            return False
+
+        steps = self._steps.get(loader_name)
+        if self._last_k_steps > 0 and steps is not None and step_index < steps - self._last_k_steps:
+            return False
+
+        if self._fraction >= 1:
+            return True
+
+        # decided from the position alone, metrics with the same seed sample the same batches, also after a resume
+        position = f"{self._seed}:{loader_name}:{epoch_index}:{step_index}".encode()
+
+        return zlib.crc32(position) / 2 ** 32 < self._fraction
@@ -0,0 +1,211 @@
+import random
+import time
+from typing import Dict, List, Optional
+
+import torch
+from decouple import Module
+
+from .events import MetricEvent
+from ..loader import LoaderStartEvent, LoaderEndEvent, LoaderProcessBatchStartEvent, LoaderProcessBatchEndEvent
+from ..model import (
+    ModelForwardStartEvent, ModelForwardEndEvent, ModelLossStartEvent, ModelLossEndEvent,
+    ModelBackwardStartEvent, ModelBackwardEndEvent, ModelScheduleStartEvent, ModelScheduleEndEvent
+)
+from ..model.stager import batch_size
+from ..state.events import CheckpointSavedEvent
+from ..settings import METRIC_TIMING_SYNCHRONIZE, METRIC_TIMING_PERCENTILES, METRIC_TIMING_RESERVOIR_SIZE
+
+
+class TimingMetric(Module):
+    def __init__(self,
+                 synchronize: bool = METRIC_TIMING_SYNCHRONIZE,
+                 percentiles: List[int] = METRIC_TIMING_PERCENTILES,
+                 reservoir_size: int = METRIC_TIMING_RESERVOIR_SIZE,
+                 ):
+        super().__init__()
+
+        # waits for queued device work, so phases measure kernels rather than launches
+        self._synchronize = synchronize and torch.cuda.is_available()
+        self._percentiles = percentiles
+        self._reservoir_size = reservoir_size
+        # a private generator, sampling must not change the training rng
+        self._random = random.Random(0)
+
+        self._loader_name: Optional[str] = None
+        self._epoch_index: Optional[int] = None
+        self._step_index: Optional[int] = None
+        self._batch_index: Optional[int] = None
+
+        # phase -> milliseconds per step, a bounded uniform sample of the loader's steps
+        self._reservoirs: Dict[str, List[float]] = {}
+        self._seen: Dict[str, int] = {}
+
+        # phase -> seconds spent in the current step, micro-batches add up
+        self._step: Dict[str, float] = {}
+        self._started: Dict[str, float] = {}
+        self._step_opened: Optional[float] = None
+        self._prepared = False
+
+        self._loader_started: float = 0.0
+        self._last_step_end: Optional[float] = None
+        self._samples = 0
+        self._steps = 0
+
+        (
+            self.sub(LoaderStartEvent, self.handle_loader_start)
+                .sub(LoaderEndEvent, self.handle_loader_end)
+                .sub(LoaderProcessBatchStartEvent, self.handle_process_batch_start)
+                .sub(LoaderProcessBatchEndEvent, self.handle_process_batch_end)
+                .sub(ModelForwardStartEvent, self.handle_forward_start)
+                .sub(ModelForwardEndEvent, self.handle_forward_end)
+                .sub(ModelLossStartEvent, self.handle_loss_start)
+                .sub(ModelLossEndEvent, self.handle_loss_end)
+                .sub(ModelBackwardStartEvent, self.handle_backward_start)
+                .sub(ModelBackwardEndEvent, self.handle_backward_end)
+                .sub(ModelScheduleStartEvent, self.handle_schedule_start)
+                .sub(ModelScheduleEndEvent, self.handle_schedule_end)
+                .sub(CheckpointSavedEvent, self.handle_checkpoint_saved)
+        )
+
+    def handle_loader_start(self, event: LoaderStartEvent):
+        self._loader_name = event.loader.name
+        self._epoch_index = event.epoch_index
+
+        self._reservoirs = {}
+        self._seen = {}
+        self._samples = 0
+        self._steps = 0
+
+        self._loader_started = self._now()
+        self._last_step_end = self._loader_started
+
+    def handle_process_batch_start(self, event: LoaderProcessBatchStartEvent):
+        self._step_index = event.step_index
+        self._batch_index = event.batch_index
+
+        self._open_step(self._now(), prepared=False)
+        self._samples += batch_size(event.batch) or 0
+
+    def handle_forward_start(self, event: ModelForwardStartEvent):
+        now = self._now()
+
+        # handlers of the batch start may run before this module's, the first forward opens the step then
+        self._open_step(now, prepared=True)
+
+        if not self._prepared:
+            self._prepared = True
+            # input_fn/target_fn, the device copy and zero_grad, everything between the batch and its first forward
+            self._add("prepare", now - self._step_opened)
+
+        self._started["forward"] = now
+
+    def handle_forward_end(self, event: ModelForwardEndEvent):
+        self._end("forward")
+
+    def handle_loss_start(self, event: ModelLossStartEvent):
+        self._start("loss")
+
+    def handle_loss_end(self, event: ModelLossEndEvent):
+        self._end("loss")
+
+    def handle_backward_start(self, event: ModelBackwardStartEvent):
+        self._start("backward")
+
+    def handle_backward_end(self, event: ModelBackwardEndEvent):
+        self._end("backward")
+
+    def handle_schedule_start(self, event: ModelScheduleStartEvent):
+        self._start("schedule")
+
+    def handle_schedule_end(self, event: ModelScheduleEndEvent):
+        self._end("schedule")
+
+    def handle_checkpoint_saved(self, event: CheckpointSavedEvent):
+        # saving and saved events of different files interleave with the asynchronous writer,
+        # so the duration is measured by the checkpoint itself
+        if event.duration is not None:
+            self._add("checkpoint", event.duration)
+
+    def handle_process_batch_end(self, event: LoaderProcessBatchEndEvent):
+        if self._step_opened is None:
+            return
+
+        now = self._now()
+        self._add("step", now - self._step_opened)
+
+        for phase, seconds in self._step.items():
+            self._record(phase, seconds * 1000)
+
+        self._step = {}
+        self._step_opened = None
+        self._last_step_end = now
+        self._steps += 1
+
+    def handle_loader_end(self, event: LoaderEndEvent):
+        elapsed = self._now() - self._loader_started
+
+        for phase, reservoir in self._reservoirs.items():
+            values = sorted(reservoir)
+
+            for percentile in self._percentiles:
+                index = min(len(values) - 1, int(round(percentile / 100 * (len(values) - 1))))
+                self._publish(f"time_ms.{phase}.p{percentile}", values[index])
+
+        if elapsed > 0 and self._steps > 0:
+            self._publish("throughput.steps_per_s", self._steps / elapsed)
+            self._publish("throughput.samples_per_s", self._samples / elapsed)
+
+    def _open_step(self, now: float, prepared: bool):
+        if self._step_opened is not None:
+            return
+
+        self._step_opened = now
+        self._prepared = prepared
+
+        if self._last_step_end is not None:
+            self._add("data_wait", now - self._last_step_end)
+
+    def _start(self, phase: str):
+        self._started[phase] = self._now()
+
+    def _end(self, phase: str):
+        started = self._started.pop(phase, None)
+
+        if started is not None:
+            self._add(phase, self._now() - started)
+
+    def _add(self, phase: str, seconds: float):
+        if self._step_opened is None:
+            # outside of a step (per epoch scheduling, checkpoints) every occurrence is reported as it is
+            self._publish(f"time_ms.{phase}", seconds * 1000)
+            return
+
+        self._step[phase] = self._step.get(phase, 0.0) + seconds
+
+    def _record(self, phase: str, value: float):
+        reservoir = self._reservoirs.setdefault(phase, [])
+        seen = self._seen.get(phase, 0) + 1
+        self._seen[phase] = seen
+
+        if len(reservoir) < self._reservoir_size:
+            reservoir.append(value)
+        else:
+            index = self._random.randrange(seen)
+            if index < self._reservoir_size:
+                reservoir[index] = value
+
+    def _publish(self, metric_name: str, metric_value: float):
+        self.pub(MetricEvent(metric_name=metric_name,
+                             metric_value=metric_value,
+                             periods={
+                                 "loader_name": self._loader_name,
+                                 "epoch_index": self._epoch_index,
+                                 "step_index": self._step_index,
+                                 "batch_index": self._batch_index,
+                             }))
+
+    def _now(self) -> float:
+        if self._synchronize:
+            torch.cuda.synchronize()
+
+        return time.perf_counter()
@@ -1,8 +1,12 @@
 from .events import *
 from .model_manager import ScheduleType, ModelManager
 from .infer_manager import InferManager
+from .sink import Sink, MemorySink, NpyChunkSink, MemmapSink
+from .stager import BatchStager
 
-__all__ = ["ScheduleType", "ModelManager", "ModelInitEvent", "ModelSaveEvent", "ModelForwardStartEvent",
+__all__ = ["ScheduleType", "ModelManager", "ModelInitEvent", "ModelSaveEvent", "ModelCompiledEvent",
+           "ModelForwardStartEvent",
            "ModelForwardEndEvent",
            "ModelLossStartEvent", "ModelLossEndEvent", "ModelBackwardStartEvent", "ModelBackwardEndEvent",
-           "ModelScheduleStartEvent", "ModelScheduleEndEvent", "InferManager"]
+           "ModelScheduleStartEvent", "ModelScheduleEndEvent", "InferManager", "BatchStager",
+           "Sink", "MemorySink", "NpyChunkSink", "MemmapSink"]
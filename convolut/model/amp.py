@@ -0,0 +1,52 @@
+from contextlib import nullcontext
+from typing import Optional, Union
+
+import torch
+
+
+def resolve_amp_dtype(device_type: str, dtype: Optional[Union[str, torch.dtype]] = None) -> torch.dtype:
+    if dtype is None:
+        # cpu autocast only supports bfloat16
+        return torch.float16 if device_type == "cuda" else torch.bfloat16
+
+    if isinstance(dtype, str):
+        return getattr(torch, dtype)
+
+    return dtype
+
+
+def check_amp(device_type: str, dtype: torch.dtype):
+    if hasattr(torch, "autocast"):
+        return
+
+    # torch 1.6 - 1.9 only autocast on cuda to float16, older versions have no amp at all
+    if not hasattr(torch.cuda, "amp"):
+        raise RuntimeError(f"amp needs torch>=1.6, torch {torch.__version__} is installed")
+
+    if device_type != "cuda" or dtype != torch.float16:
+        raise RuntimeError(f"amp on {device_type} with {dtype} needs torch>=1.10, "
+                           f"torch {torch.__version__} is installed")
+
+
+def autocast(device_type: str, dtype: torch.dtype, enabled: bool):
+    if not enabled:
+        # a disabled torch.autocast still costs a few microseconds per enter/exit
+        return nullcontext()
+
+    if hasattr(torch, "autocast"):
+        return torch.autocast(device_type=device_type, dtype=dtype, enabled=enabled)
+
+    check_amp(device_type, dtype)
+
+    return torch.cuda.amp.autocast(enabled=enabled)
+
+
+def grad_scaler(device_type: str, enabled: bool):
+    if hasattr(getattr(torch, "amp", None), "GradScaler"):
+        return torch.amp.GradScaler(device_type, enabled=enabled)
+
+    if not hasattr(torch.cuda, "amp"):
+        raise RuntimeError(f"amp needs torch>=1.6, torch {torch.__version__} is installed")
+
+    # older torch only ships the cuda scaler
+    return torch.cuda.amp.GradScaler(enabled=enabled and device_type == "cuda")
@@ -0,0 +1,112 @@
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import torch
+from decouple import Event
+from torch import nn
+
+from .events import ModelCompiledEvent
+from ..constants import CompileMode
+
+
+def _signature(data: Any) -> Hashable:
+    if isinstance(data, torch.Tensor):
+        return tuple(data.shape), data.dtype, data.device.type
+
+    if isinstance(data, dict):
+        return tuple((key, _signature(value)) for key, value in data.items())
+
+    if isinstance(data, (list, tuple)):
+        return type(data).__name__, tuple(_signature(value) for value in data)
+
+    return type(data).__name__
+
+
+class ModelCompiler:
+    def __init__(self,
+                 model: nn.Module,
+                 mode: Optional[str],
+                 model_kwargs: Dict,
+                 publish: Callable[[Event], None],
+                 ):
+        if mode not in (None, CompileMode.Trace, CompileMode.Script, CompileMode.Compile):
+            raise ValueError(f'unknown compile mode:{mode}')
+
+        self._model = model
+        self._mode = mode
+        self._model_kwargs = model_kwargs
+        self._publish = publish
+
+        self._compiled: Optional[Callable[..., Any]] = None
+        self._cache: Dict[Hashable, Callable[..., Any]] = {}
+
+    def prepare(self, model: Optional[nn.Module] = None):
+        # model replaces the executed module, e.g. with its DistributedDataParallel wrapper
+        if model is not None:
+            self._model = model
+
+        if self._mode is None:
+            return
+
+        started = time.perf_counter()
+        try:
+            if self._mode == CompileMode.Script:
+                self._compiled = torch.jit.script(self._model)
+            elif self._mode == CompileMode.Compile:
+                if not hasattr(torch, "compile"):
+                    raise RuntimeError("torch.compile is not available")
+
+                self._compiled = torch.compile(self._model)
+        except Exception as e:
+            self._publish(ModelCompiledEvent(mode=self._mode,
+                                             duration=time.perf_counter() - started,
+                                             compiled=False,
+                                             error=repr(e)))
+            # fall back to eager execution for the whole run
+            self._mode = None
+
+    def __call__(self, input: Any) -> Any:
+        if self._mode is None:
+            return self._eager(input)
+
+        # traced graphs are specialised on shapes, dtypes, train/eval and autocast state
+        key = (self._model.training, torch.is_autocast_enabled(), _signature(input))
+
+        if key in self._cache:
+            return self._cache[key](input)
+
+        return self._warm_up(key, input)
+
+    def _eager(self, input: Any) -> Any:
+        return self._model.forward(input, **self._model_kwargs)
+
+    def _build(self, input: Any) -> Callable[..., Any]:
+        if self._mode == CompileMode.Trace:
+            if self._model_kwargs:
+                raise RuntimeError("model_kwargs are not supported by tracing")
+
+            return torch.jit.trace(self._model, (input,), strict=False)
+
+        compiled = self._compiled
+        return lambda x: compiled(x, **self._model_kwargs)
+
+    def _warm_up(self, key: Hashable, input: Any) -> Any:
+        started = time.perf_counter()
+
+        try:
+            fn = self._build(input)
+            output = fn(input)
+            error = None
+        except Exception as e:
+            fn = self._eager
+            output = fn(input)
+            error = repr(e)
+
+        self._cache[key] = fn
+        self._publish(ModelCompiledEvent(mode=self._mode,
+                                         key=key,
+                                         duration=time.perf_counter() - started,
+                                         compiled=error is None,
+                                         error=error))
+
+        return output
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Optional
 
 import torch
 from decouple import Event
@@ -13,6 +13,7 @@ class ModelInitEvent(Event):
     model: nn.Module = None
     optimizer: Any = None
     scheduler: Any = None
+    scaler: Any = None
     runner: Runner = None
 
 
@@ -21,6 +22,7 @@ class ModelSaveEvent(Event):
     model: nn.Module = None
     optimizer: Any = None
     scheduler: Any = None
+    scaler: Any = None
     epoch_index: int = None
 
 
@@ -34,6 +36,15 @@ class ModelSaveLastEvent(ModelSaveEvent):
     pass
 
 
+@dataclass
+class ModelCompiledEvent(Event):
+    mode: str = None
+    key: Any = None
+    duration: float = None
+    compiled: bool = None
+    error: Optional[str] = None
+
+
 @dataclass
 class ModelForwardStartEvent(Event):
     input: torch.Tensor = None
@@ -54,6 +65,9 @@ class ModelLossStartEvent(Event):
     epoch_index: int = None
     step_index: int = None
     batch_index: int = None
+    micro_batch_index: int = 0
+    # samples in the (micro-)batch, None when it cannot be told from the target
+    batch_size: Optional[int] = None
 
 
 @dataclass
@@ -65,6 +79,8 @@ class ModelLossEndEvent(Event):
     epoch_index: int = None
     step_index: int = None
     batch_index: int = None
+    micro_batch_index: int = 0
+    batch_size: Optional[int] = None
 
 
 @dataclass
@@ -1,13 +1,17 @@
-from typing import Dict, Any, Callable, Optional
+from typing import Dict, Any, Callable, Optional, List, Tuple
 
 import torch
 from decouple import Module
 from torch import nn
 
+from .compiler import ModelCompiler
+from .sink import Sink
+from .stager import BatchStager, batch_size, cat_batch, map_batch, split_batch
 from .events import (
     ModelForwardStartEvent, ModelForwardEndEvent, ModelInitEvent)
-from ..loader import LoaderProcessBatchStartEvent
-from ..runner import RunnerStartEvent
+from ..loader import LoaderStartEvent, LoaderProcessBatchStartEvent, LoaderEndEvent
+from ..runner import RunnerStartEvent, RunnerEndEvent
+from ..settings import MODEL_MANAGER_NON_BLOCKING, MODEL_MANAGER_COMPILE_MODE, MODEL_INFER_MANAGER_BATCH_SIZE
 
 
 class InferManager(Module):
@@ -16,18 +20,44 @@ class InferManager(Module):
             model: nn.Module,
             device,
             input_fn: Callable[[Any], torch.Tensor] = lambda batch: batch["input"],
-            model_kwargs: Optional[Dict] = None
+            model_kwargs: Optional[Dict] = None,
+            non_blocking: bool = MODEL_MANAGER_NON_BLOCKING,
+            compile_mode: Optional[str] = MODEL_MANAGER_COMPILE_MODE,
+            sink: Optional[Sink] = None,
+            batch_size: Optional[int] = MODEL_INFER_MANAGER_BATCH_SIZE,
     ):
         super().__init__()
         self._model = model
         self._model_kwargs = model_kwargs if model_kwargs else {}
         self._device = device
+        self._stager = BatchStager(device=self._device, non_blocking=non_blocking)
+        # the original module is kept in self._model, so checkpoints save its state_dict
+        self._compiler = ModelCompiler(model=self._model,
+                                       mode=compile_mode,
+                                       model_kwargs=self._model_kwargs,
+                                       publish=self.pub)
 
         self._input_fn = input_fn
 
+        self._sink = sink
+        self._batch_size = batch_size
+
+        device_type = torch.device(self._device).type
+        self._offload_stream = torch.cuda.Stream(device=self._device) \
+            if device_type == "cuda" and torch.cuda.is_available() else None
+
+        # small incoming batches waiting to be coalesced into one of batch_size samples
+        self._pending_inputs: List[Any] = []
+        self._pending_size = 0
+        # output of the previous forward, still being copied to the host
+        self._pending_output: Optional[Tuple[Any, Optional[torch.cuda.Event]]] = None
+
         (
             self.sub(RunnerStartEvent, self.handle_runner_start)
+                .sub(LoaderStartEvent, self.handle_loader_start)
                 .sub(LoaderProcessBatchStartEvent, self.handle_process_batch_start)
+                .sub(LoaderEndEvent, self.handle_loader_end)
+                .sub(RunnerEndEvent, self.handle_runner_end)
         )
 
     def handle_runner_start(self, event: RunnerStartEvent):
@@ -36,15 +66,113 @@ class InferManager(Module):
 
         self._model.eval()
         self._model.to(self._device)
+        self._compiler.prepare()
+
+    def handle_loader_start(self, event: LoaderStartEvent):
+        # with loader prefetch the next batch is copied to the device while the current one is processed
+        event.loader.set_stage_fn(self._stager.prefetch)
 
     def handle_process_batch_start(self, event: LoaderProcessBatchStartEvent):
-        inpt = self._input_fn(event.batch).to(self._device)
+        inpt = self._input_fn(event.batch)
+
+        if not self._batch_size:
+            self._process(inpt)
+            return
+
+        self._pending_inputs.append(inpt)
+        self._pending_size += batch_size(inpt) or 1
+
+        if self._pending_size >= self._batch_size:
+            chunks = split_batch(cat_batch(self._pending_inputs), self._batch_size)
+            self._pending_inputs = []
+            self._pending_size = 0
+
+            for chunk in chunks:
+                if batch_size(chunk) == self._batch_size:
+                    self._process(chunk)
+                else:
+                    self._pending_inputs.append(chunk)
+                    self._pending_size += batch_size(chunk)
+
+    def handle_loader_end(self, event: LoaderEndEvent):
+        if self._pending_inputs:
+            self._process(cat_batch(self._pending_inputs))
+            self._pending_inputs = []
+            self._pending_size = 0
+
+        self._drain()
+
+        if self._sink is not None:
+            self._sink.flush()
+
+    def handle_runner_end(self, event: RunnerEndEvent):
+        self._drain()
+
+        if self._sink is not None:
+            self._sink.close()
+
+    def _process(self, inpt: Any):
+        inpt = self._stager(inpt)
         with torch.no_grad():
             self._forward(input=inpt)
 
     def _forward(self, input: torch.Tensor):
         self.pub(ModelForwardStartEvent(input=input))
 
-        output = self._model.forward(input, **self._model_kwargs)
+        output = self._compiler(input)
 
         self.pub(ModelForwardEndEvent(output=output))
+
+        if self._sink is not None:
+            self._collect(output)
+
+    def _collect(self, output: Any):
+        if not isinstance(output, torch.Tensor) and not self._sink.accepts_structures:
+            raise TypeError(f"{type(self._sink).__name__} writes tensors but the model returned "
+                            f"{type(output).__name__}, use a sink with accepts_structures = True")
+
+        # the copy of this output is queued before the previous one is written, so the sink works
+        # on the host while the copy and the next forward run on the device
+        offloaded = self._offload(output)
+        self._drain()
+        self._pending_output = offloaded
+
+    def _offload(self, output: Any) -> Tuple[Any, Optional[torch.cuda.Event]]:
+        if self._offload_stream is None:
+            return map_batch(lambda t: t.detach().cpu() if isinstance(t, torch.Tensor) else t.to("cpu"), output), None
+
+        self._offload_stream.wait_stream(torch.cuda.current_stream(self._device))
+
+        # every tensor of the output is copied on the offload stream, one event marks the end of all copies
+        with torch.cuda.stream(self._offload_stream):
+            host = map_batch(self._copy_to_host, output)
+
+            copied = torch.cuda.Event()
+            copied.record(self._offload_stream)
+
+        return host, copied
+
+    def _copy_to_host(self, output: Any) -> Any:
+        if not isinstance(output, torch.Tensor):
+            return output.to("cpu")
+
+        if not output.is_cuda:
+            return output.detach()
+
+        host = torch.empty(output.shape, dtype=output.dtype, pin_memory=True)
+        host.copy_(output.detach(), non_blocking=True)
+        output.record_stream(self._offload_stream)
+
+        return host
+
+    def _drain(self):
+        if self._pending_output is None:
+            return
+
+        host, copied = self._pending_output
+        self._pending_output = None
+
+        if copied is not None:
+            copied.synchronize()
+
+        self._sink.write(host)
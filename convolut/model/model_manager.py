@@ -1,20 +1,36 @@
-from statistics import mean
-from typing import Dict, Any, Callable, Optional, List
+import contextlib
+from typing import Dict, Any, Callable, Optional, Union, List, Tuple
 
 import torch
+import torch.distributed as dist
 from decouple import Module
 from torch import nn
+from torch.nn.parallel import DistributedDataParallel
 
+from .amp import autocast, check_amp, grad_scaler, resolve_amp_dtype
+from .compiler import ModelCompiler
+from .stager import BatchStager, batch_size, split_batch
 from .events import (
     ModelForwardStartEvent, ModelForwardEndEvent, ModelBackwardStartEvent, ModelBackwardEndEvent, ModelLossEndEvent,
     ModelLossStartEvent, ModelScheduleEndEvent, ModelScheduleStartEvent, ModelInitEvent,
     ModelSaveLastEvent, ModelSaveBestEvent
 )
 from ..constants import LoaderName, ScheduleType
+from ..distributed import get_world_size, is_distributed
 from ..epoch import EpochStartEvent, EpochEndEvent
-from ..loader import LoaderStartEvent, LoaderProcessBatchStartEvent
+from ..events import StateCollectEvent, StateRestoreEvent
+from ..loader import LoaderStartEvent, LoaderEndEvent, LoaderProcessBatchStartEvent
+from ..metric.metric_manager import MetricManagerFlushEvent
 from ..runner import RunnerStartEvent
-from ..settings import MODEL_MANAGER_SCHEDULE_TYPE
+from ..settings import (
+    MODEL_MANAGER_SCHEDULE_TYPE,
+    MODEL_MANAGER_NON_BLOCKING,
+    MODEL_MANAGER_AMP,
+    MODEL_MANAGER_AMP_DTYPE,
+    MODEL_MANAGER_COMPILE_MODE,
+    MODEL_MANAGER_ACCUMULATE_STEPS,
+    MODEL_MANAGER_MICRO_BATCH_SIZE
+)
 
 
 class ModelManager(Module):
@@ -32,12 +48,30 @@ class ModelManager(Module):
             input_fn: Callable[[Any], torch.Tensor] = lambda batch: batch["input"],
             target_fn: Callable[[Any], torch.Tensor] = lambda batch: batch["target"],
 
-            model_kwargs: Optional[Dict] = None
+            model_kwargs: Optional[Dict] = None,
+
+            non_blocking: bool = MODEL_MANAGER_NON_BLOCKING,
+
+            amp: bool = MODEL_MANAGER_AMP,
+            amp_dtype: Optional[Union[str, torch.dtype]] = MODEL_MANAGER_AMP_DTYPE,
+
+            accumulate_steps: int = MODEL_MANAGER_ACCUMULATE_STEPS,
+            micro_batch_size: Optional[int] = MODEL_MANAGER_MICRO_BATCH_SIZE,
+
+            compile_mode: Optional[str] = MODEL_MANAGER_COMPILE_MODE,
     ):
         super().__init__()
         self._model = model
+        # module executed for forward, the DistributedDataParallel wrapper when running distributed
+        self._ddp_model: Optional[DistributedDataParallel] = None
         self._model_kwargs = model_kwargs if model_kwargs else {}
         self._device = device
+        self._stager = BatchStager(device=self._device, non_blocking=non_blocking)
+        # the original module is kept in self._model, so checkpoints save its state_dict
+        self._compiler = ModelCompiler(model=self._model,
+                                       mode=compile_mode,
+                                       model_kwargs=self._model_kwargs,
+                                       publish=self.pub)
 
         self._criterion = criterion
         self._optimizer = optimizer
@@ -48,11 +82,30 @@ class ModelManager(Module):
         self._input_fn = input_fn
         self._target_fn = target_fn
 
+        self._amp = amp
+        self._amp_device_type = torch.device(self._device).type
+        self._amp_dtype = resolve_amp_dtype(self._amp_device_type, amp_dtype)
+        if self._amp:
+            # an unsupported device or dtype is reported here rather than on the first step
+            check_amp(self._amp_device_type, self._amp_dtype)
+
+        self._scaler = grad_scaler(self._amp_device_type, enabled=True) if self._amp else None
+
+        self._accumulate_steps = accumulate_steps
+        self._micro_batch_size = micro_batch_size
+
         assert (self._optimizer and self._scheduler)
+        assert self._accumulate_steps >= 1
 
         self._current_epoch_index = None
         self._current_step_index = None
         self._current_batch_index = None
+        self._current_micro_batch_index = 0
+        self._current_micro_batch_weight = 1.0
+        self._current_accumulated_steps = 0
+        # micro-steps of the current accumulation window, shorter than accumulate_steps at the end of a loader
+        self._current_window_steps = self._accumulate_steps
+        self._current_expected_steps: Optional[int] = None
 
         self._current_loader_name = None
         self._current_backward_required = False
@@ -60,36 +113,56 @@ class ModelManager(Module):
         self._current_output: torch.Tensor = None
         self._current_loss = None
 
-        self._current_epoch_valid_loss_values: List[float] = []
+        # the validation loss aggregated by MetricManager, the best checkpoint follows its sampling and weights
         self._current_epoch_valid_mean_loss: float = None
+        self._last_checked_epoch_index = -1
+        self._best_valid_mean_loss: float = None
 
         (
             self.sub(RunnerStartEvent, self.handle_runner_start)
                 .sub(EpochStartEvent, self.handle_epoch_start)
                 .sub(LoaderStartEvent, self.handle_loader_start)
                 .sub(LoaderProcessBatchStartEvent, self.handle_process_batch_start)
+                .sub(LoaderEndEvent, self.handle_loader_end)
                 .sub(EpochEndEvent, self.handle_epoch_end)
+                .sub(MetricManagerFlushEvent, self.handle_metric_manager_flush)
+                .sub(StateCollectEvent, self.handle_state_collect)
+                .sub(StateRestoreEvent, self.handle_state_restore)
         )
 
     def handle_runner_start(self, event: RunnerStartEvent):
         self.pub(ModelInitEvent(model=self._model,
                                 optimizer=self._optimizer,
                                 scheduler=self._scheduler,
+                                scaler=self._scaler,
                                 runner=event.runner))
 
         self._model.to(self._device)
 
+        if is_distributed():
+            device = torch.device(self._device)
+            device_ids = [device] if device.type == "cuda" else None
+            self._ddp_model = DistributedDataParallel(self._model, device_ids=device_ids)
+
+        self._compiler.prepare(model=self._ddp_model)
+
     def handle_epoch_start(self, event: EpochStartEvent):
         self._current_epoch_index = event.epoch.epoch_index
 
     def handle_loader_start(self, event: LoaderStartEvent):
         self._current_loader_name = event.loader.name
         self._current_backward_required = self._current_loader_name == LoaderName.Train
+        self._current_expected_steps = event.loader.expected_steps()
+
+        # with loader prefetch the next batch is copied to the device while the current one is processed
+        event.loader.set_stage_fn(self._stager.prefetch)
+
+        model = self._ddp_model if self._ddp_model is not None else self._model
 
         if self._current_backward_required:
-            self._model.train()
+            model.train()
         else:
-            self._model.eval()
+            model.eval()
 
     def handle_process_batch_start(self, event: LoaderProcessBatchStartEvent):
         self._current_loader_name = event.loader.name
@@ -97,81 +170,205 @@ class ModelManager(Module):
         self._current_step_index = event.step_index
         self._current_batch_index = event.batch_index
 
-        inpt = self._input_fn(event.batch).to(self._device)
-        target = self._target_fn(event.batch).to(self._device)
+        inpt = self._stager(self._input_fn(event.batch))
+        target = self._stager(self._target_fn(event.batch))
+
+        micro_batches = self._split(inpt=inpt, target=target)
 
         if self._current_backward_required:
-            self._forward(input=inpt)
-            self._loss(output=self._current_output, target=target)
-            self._backward()
+            if self._current_accumulated_steps == 0:
+                self._optimizer.zero_grad()
+                self._current_window_steps = self._window_steps()
+
+            self._current_accumulated_steps += 1
+            step_required = self._current_accumulated_steps == self._current_window_steps
+
+            for micro_batch_index, (micro_input, micro_target, weight) in enumerate(micro_batches):
+                self._current_micro_batch_index = micro_batch_index
+                self._current_micro_batch_weight = weight
+                step = step_required and micro_batch_index == len(micro_batches) - 1
+
+                with self._no_sync(step=step):
+                    with self._autocast():
+                        self._forward(input=micro_input)
+                        self._loss(output=self._current_output, target=micro_target)
+                    self._backward(step=step)
+
+            # per batch scheduling follows optimizer steps, not loader batches
+            if step_required and self._schedule_type == ScheduleType.PerBatch:
+                self._schedule()
+        else:
+            for micro_batch_index, (micro_input, micro_target, weight) in enumerate(micro_batches):
+                self._current_micro_batch_index = micro_batch_index
+                self._current_micro_batch_weight = weight
+
+                with torch.no_grad(), self._autocast():
+                    self._forward(input=micro_input)
+                    self._loss(output=self._current_output, target=micro_target)
+
+    def handle_loader_end(self, event: LoaderEndEvent):
+        # gradients of an incomplete accumulation window must not leak into the next loader/epoch
+        if self._current_accumulated_steps > 0:
+            # only reached when the number of steps was not known in advance
+            self._rescale_window()
+            self._step()
 
             if self._schedule_type == ScheduleType.PerBatch:
                 self._schedule()
-        else:
-            with torch.no_grad():
-                self._forward(input=inpt)
-                self._loss(output=self._current_output, target=target)
 
     def handle_epoch_end(self, event: EpochEndEvent):
         if self._schedule_type == ScheduleType.PerEpoch:
             self._schedule()
 
-        self._check_and_save_best()
-
         self.pub(ModelSaveLastEvent(model=self._model,
                                     optimizer=self._optimizer,
                                     scheduler=self._scheduler,
+                                    scaler=self._scaler,
                                     epoch_index=self._current_epoch_index))
 
-    def _check_and_save_best(self):
-        if len(self._current_epoch_valid_loss_values) == 0:
+    def handle_state_collect(self, event: StateCollectEvent):
+        # a resumed run only saves a new best checkpoint when it beats the best of the whole run
+        event.state["model_manager"] = {
+            "best_valid_mean_loss": self._best_valid_mean_loss,
+        }
+
+    def handle_state_restore(self, event: StateRestoreEvent):
+        if "model_manager" not in event.state:
             return
 
-        previous_loss_value = self._current_epoch_valid_mean_loss
-        self._current_epoch_valid_mean_loss = mean(self._current_epoch_valid_loss_values)
-        self._current_epoch_valid_loss_values = []
+        self._best_valid_mean_loss = event.state["model_manager"]["best_valid_mean_loss"]
+
+    def handle_metric_manager_flush(self, event: MetricManagerFlushEvent):
+        # a per loader flush repeats the epochs seen so far, each epoch is checked once
+        for epoch_index, loaders in event.metrics.get("loss", {}).items():
+            if epoch_index > self._last_checked_epoch_index and LoaderName.Valid in loaders:
+                self._last_checked_epoch_index = epoch_index
+                self._check_and_save_best(valid_mean_loss=loaders[LoaderName.Valid], epoch_index=epoch_index)
 
-        if previous_loss_value and previous_loss_value > self._current_epoch_valid_mean_loss:
+    def _check_and_save_best(self, valid_mean_loss: float, epoch_index: int):
+        self._current_epoch_valid_mean_loss = valid_mean_loss
+
+        # compared against the best epoch so far, not just the previous one
+        if self._best_valid_mean_loss is None or self._best_valid_mean_loss > self._current_epoch_valid_mean_loss:
+            self._best_valid_mean_loss = self._current_epoch_valid_mean_loss
             self.pub(ModelSaveBestEvent(model=self._model,
                                         optimizer=self._optimizer,
                                         scheduler=self._scheduler,
-                                        epoch_index=self._current_epoch_index))
+                                        scaler=self._scaler,
+                                        epoch_index=epoch_index))
+
+    def _split(self, inpt: Any, target: Any) -> List[Tuple[Any, Any, float]]:
+        if not self._micro_batch_size:
+            return [(inpt, target, 1.0)]
+
+        size = batch_size(inpt)
+        if size is None or size <= self._micro_batch_size:
+            return [(inpt, target, 1.0)]
+
+        inputs = split_batch(inpt, self._micro_batch_size)
+        targets = split_batch(target, self._micro_batch_size)
+
+        # weights make the micro-batch losses add up to the full batch mean loss
+        return [(micro_input, micro_target, batch_size(micro_input) / size)
+                for micro_input, micro_target in zip(inputs, targets)]
+
+    def _autocast(self):
+        return autocast(device_type=self._amp_device_type, dtype=self._amp_dtype, enabled=self._amp)
 
     def _forward(self, input: torch.Tensor):
         self.pub(ModelForwardStartEvent(input=input))
 
-        output = self._model.forward(input, **self._model_kwargs)
+        output = self._compiler(input)
         self._current_output = output
 
         self.pub(ModelForwardEndEvent(output=output))
 
     def _loss(self, output: torch.Tensor, target: torch.Tensor):
+        size = batch_size(target)
+
         self.pub(ModelLossStartEvent(output=output,
                                      target=target,
                                      loader_name=self._current_loader_name,
+                                     epoch_index=self._current_epoch_index,
                                      step_index=self._current_step_index,
-                                     batch_index=self._current_batch_index))
+                                     batch_index=self._current_batch_index,
+                                     micro_batch_index=self._current_micro_batch_index,
+                                     batch_size=size))
 
         loss = self._criterion(output, target)
         self._current_loss = loss
-        if self._current_loader_name == LoaderName.Valid:
-            self._current_epoch_valid_loss_values.append(loss.item())
 
         self.pub(ModelLossEndEvent(loss=loss,
                                    epoch_index=self._current_epoch_index,
                                    loader_name=self._current_loader_name,
                                    step_index=self._current_step_index,
-                                   batch_index=self._current_batch_index))
+                                   batch_index=self._current_batch_index,
+                                   micro_batch_index=self._current_micro_batch_index,
+                                   batch_size=size))
 
-    def _backward(self):
+    def _backward(self, step: bool = True):
         self.pub(ModelBackwardStartEvent())
 
-        self._optimizer.zero_grad()
-        self._current_loss.backward()
-        self._optimizer.step()
+        loss = self._current_loss
+        if self._current_micro_batch_weight != 1.0 or self._current_window_steps != 1:
+            loss = loss * (self._current_micro_batch_weight / self._current_window_steps)
+
+        self._loss_backward(loss)
+
+        if step:
+            self._step()
 
         self.pub(ModelBackwardEndEvent())
 
+    def _window_steps(self) -> int:
+        if self._current_expected_steps is None:
+            return self._accumulate_steps
+
+        # the last window of a loader holds the remaining steps, its losses are averaged over them
+        return max(1, min(self._accumulate_steps, self._current_expected_steps - self._current_step_index))
+
+    def _no_sync(self, step: bool):
+        if self._ddp_model is not None and not step:
+            # gradients are all-reduced only once per accumulation window, forward has to run
+            # inside no_sync too, otherwise DDP prepares the reduction of every micro-step
+            return self._ddp_model.no_sync()
+
+        return contextlib.nullcontext()
+
+    def _rescale_window(self):
+        # the losses of this window were scaled for more micro-steps than it holds,
+        # its gradients were also never all-reduced
+        factor = self._current_window_steps / self._current_accumulated_steps
+        if self._ddp_model is not None:
+            factor /= get_world_size()
+
+        for group in self._optimizer.param_groups:
+            for parameter in group["params"]:
+                if parameter.grad is None:
+                    continue
+
+                if self._ddp_model is not None:
+                    dist.all_reduce(parameter.grad)
+
+                parameter.grad.mul_(factor)
+
+    def _loss_backward(self, loss: torch.Tensor):
+        if self._scaler is not None:
+            self._scaler.scale(loss).backward()
+        else:
+            loss.backward()
+
+    def _step(self):
+        if self._scaler is not None:
+            # gradients hold their real values at step time; the step is skipped on inf/nan
+            self._scaler.unscale_(self._optimizer)
+            self._scaler.step(self._optimizer)
+            self._scaler.update()
+        else:
+            self._optimizer.step()
+
+        self._current_accumulated_steps = 0
+
     def _schedule(self):
         self.pub(ModelScheduleStartEvent())
 
@@ -0,0 +1,136 @@
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import torch
+
+from ..settings import MODEL_SINK_FOLDER, MODEL_SINK_PREFIX, MODEL_SINK_CHUNK_SIZE
+
+
+def _to_numpy(output: torch.Tensor):
+    if output.dtype in (torch.float16, torch.bfloat16):
+        # numpy has no bfloat16
+        output = output.float()
+
+    return output.numpy()
+
+
+class Sink(ABC):
+    # sinks receive a single tensor per forward unless they declare they handle nested dict/list/tuple outputs
+    accepts_structures = False
+
+    @abstractmethod
+    def write(self, output: torch.Tensor):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class MemorySink(Sink):
+    def __init__(self, size: Optional[int] = None):
+        self._size = size
+        self._buffer: Optional[torch.Tensor] = None
+        self._chunks: List[torch.Tensor] = []
+        self._length = 0
+
+    def write(self, output: torch.Tensor):
+        count = output.size(0)
+
+        if self._size is not None:
+            if self._buffer is None:
+                self._buffer = torch.empty((self._size,) + tuple(output.shape[1:]), dtype=output.dtype)
+
+            self._buffer[self._length:self._length + count].copy_(output)
+        else:
+            self._chunks.append(output)
+
+        self._length += count
+
+    def result(self) -> torch.Tensor:
+        if self._size is not None:
+            return self._buffer[:self._length]
+
+        if len(self._chunks) > 1:
+            self._chunks = [torch.cat(self._chunks)]
+
+        return self._chunks[0] if self._chunks else torch.empty(0)
+
+
+class NpyChunkSink(Sink):
+    def __init__(self,
+                 folder: str = MODEL_SINK_FOLDER,
+                 prefix: str = MODEL_SINK_PREFIX,
+                 chunk_size: int = MODEL_SINK_CHUNK_SIZE,
+                 ):
+        self._folder = folder
+        os.makedirs(self._folder, exist_ok=True)
+
+        self._prefix = prefix
+        self._chunk_size = chunk_size
+
+        self._buffer: Optional[torch.Tensor] = None
+        self._length = 0
+        self._chunk_index = 0
+
+    def write(self, output: torch.Tensor):
+        if self._buffer is None:
+            self._buffer = torch.empty((self._chunk_size,) + tuple(output.shape[1:]), dtype=output.dtype)
+
+        while output.size(0) > 0:
+            count = min(output.size(0), self._chunk_size - self._length)
+            self._buffer[self._length:self._length + count].copy_(output[:count])
+            self._length += count
+            output = output[count:]
+
+            if self._length == self._chunk_size:
+                self.flush()
+
+    def flush(self):
+        if self._length == 0:
+            return
+
+        import numpy as np
+
+        filepath = os.path.join(self._folder, f'{self._prefix}_{self._chunk_index:05d}.npy')
+        np.save(filepath, _to_numpy(self._buffer[:self._length]))
+
+        self._chunk_index += 1
+        self._length = 0
+
+
+class MemmapSink(Sink):
+    def __init__(self,
+                 size: int,
+                 folder: str = MODEL_SINK_FOLDER,
+                 prefix: str = MODEL_SINK_PREFIX,
+                 ):
+        self._size = size
+
+        self._folder = folder
+        os.makedirs(self._folder, exist_ok=True)
+        self._filepath = os.path.join(self._folder, f'{prefix}.npy')
+
+        self._memmap = None
+        self._length = 0
+
+    def write(self, output: torch.Tensor):
+        array = _to_numpy(output)
+
+        if self._memmap is None:
+            import numpy as np
+
+            self._memmap = np.lib.format.open_memmap(self._filepath,
+                                                     mode="w+",
+                                                     dtype=array.dtype,
+                                                     shape=(self._size,) + array.shape[1:])
+
+        self._memmap[self._length:self._length + array.shape[0]] = array
+        self._length += array.shape[0]
+
+    def flush(self):
+        if self._memmap is not None:
+            self._memmap.flush()
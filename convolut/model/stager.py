@@ -0,0 +1,135 @@
+from typing import Any, Callable, List, Optional, Union
+
+import torch
+
+
+def map_batch(fn: Callable[[Any], Any], data: Any) -> Any:
+    if isinstance(data, torch.Tensor):
+        return fn(data)
+
+    if isinstance(data, dict):
+        return type(data)((key, map_batch(fn, value)) for key, value in data.items())
+
+    if isinstance(data, tuple) and hasattr(data, "_fields"):
+        return type(data)(*[map_batch(fn, value) for value in data])
+
+    if isinstance(data, (list, tuple)):
+        return type(data)(map_batch(fn, value) for value in data)
+
+    if hasattr(data, "to"):
+        return fn(data)
+
+    return data
+
+
+class BatchStager:
+    def __init__(self,
+                 device: Union[str, torch.device],
+                 non_blocking: bool = True,
+                 ):
+        self._device = torch.device(device)
+
+        # on cpu-only machines (or when disabled) staging is a plain blocking .to(device)
+        self._non_blocking = non_blocking and self._device.type == "cuda" and torch.cuda.is_available()
+        self._stream = torch.cuda.Stream(device=self._device) if self._non_blocking else None
+
+    def prefetch(self, data: Any) -> Any:
+        # runs on the loader's prefetch thread, the copy of the next batch is issued on a side stream
+        # while the compute stream still runs the kernels of the current batch
+        if not self._non_blocking:
+            return data
+
+        with torch.cuda.stream(self._stream):
+            staged = map_batch(self._copy, data)
+
+        # only the prefetch thread waits for the copy, the batch is complete once it is queued
+        self._stream.synchronize()
+
+        return staged
+
+    def __call__(self, data: Any) -> Any:
+        if not self._non_blocking:
+            return map_batch(lambda t: t.to(self._device), data)
+
+        current_stream = torch.cuda.current_stream(self._device)
+
+        return map_batch(lambda t: self._stage(t, current_stream), data)
+
+    def _copy(self, data: Any) -> Any:
+        if not isinstance(data, torch.Tensor):
+            return data.to(self._device)
+
+        if data.device.type == "cpu" and not data.is_pinned():
+            data = data.pin_memory()
+
+        return data.to(self._device, non_blocking=True)
+
+    def _stage(self, data: Any, stream: torch.cuda.Stream) -> Any:
+        if not isinstance(data, torch.Tensor):
+            return data.to(self._device)
+
+        if data.is_cuda:
+            # staged ahead by prefetch, memory was allocated on the side stream but is consumed on the compute stream
+            data.record_stream(stream)
+            return data
+
+        # batches that were not staged ahead (no loader prefetch) are copied in order on the compute stream
+        return data.to(self._device, non_blocking=True)
+
+
+def batch_size(data: Any) -> Optional[int]:
+    if isinstance(data, torch.Tensor):
+        return data.size(0) if data.dim() > 0 else None
+
+    values = data.values() if isinstance(data, dict) else data if isinstance(data, (list, tuple)) else []
+
+    for value in values:
+        size = batch_size(value)
+        if size is not None:
+            return size
+
+    return None
+
+
+def split_batch(data: Any, size: int) -> List[Any]:
+    if isinstance(data, torch.Tensor):
+        return list(data.split(size)) if data.dim() > 0 else [data]
+
+    if isinstance(data, dict):
+        keys = list(data.keys())
+        parts = [split_batch(data[key], size) for key in keys]
+    elif isinstance(data, (list, tuple)):
+        keys = None
+        parts = [split_batch(value, size) for value in data]
+    else:
+        return [data]
+
+    count = max([len(part) for part in parts] + [1])
+    # leaves that cannot be split (scalars, strings, ...) are shared by every chunk
+    chunks = [[part[i] if len(part) > 1 else part[0] for part in parts] for i in range(count)]
+
+    if keys is not None:
+        return [type(data)(zip(keys, chunk)) for chunk in chunks]
+
+    if hasattr(data, "_fields"):
+        return [type(data)(*chunk) for chunk in chunks]
+
+    return [type(data)(chunk) for chunk in chunks]
+
+
+def cat_batch(items: List[Any]) -> Any:
+    first = items[0]
+
+    if isinstance(first, torch.Tensor):
+        return torch.cat(items) if first.dim() > 0 else first
+
+    if isinstance(first, dict):
+        return type(first)((key, cat_batch([item[key] for item in items])) for key in first.keys())
+
+    if isinstance(first, tuple) and hasattr(first, "_fields"):
+        return type(first)(*[cat_batch(list(values)) for values in zip(*items)])
+
+    if isinstance(first, (list, tuple)):
+        return type(first)(cat_batch(list(values)) for values in zip(*items))
+
+    return first
@@ -0,0 +1,3 @@
+from .trace import TraceProfiler
+
+__all__ = ["TraceProfiler"]
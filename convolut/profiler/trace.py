@@ -0,0 +1,126 @@
+import os
+from typing import Any, Optional
+
+import torch
+from decouple import Module
+
+from ..distributed import get_rank
+from ..loader import LoaderProcessBatchStartEvent, LoaderProcessBatchEndEvent
+from ..runner import RunnerStartEvent, RunnerEndEvent
+from ..settings import (
+    PROFILER_TRACE_FOLDER,
+    PROFILER_TRACE_LOADER_NAME,
+    PROFILER_TRACE_WAIT,
+    PROFILER_TRACE_WARMUP,
+    PROFILER_TRACE_ACTIVE,
+    PROFILER_TRACE_REPEAT,
+    PROFILER_TRACE_SKIP_FIRST,
+    PROFILER_TRACE_ROW_LIMIT,
+    PROFILER_TRACE_SORT_BY,
+    PROFILER_TRACE_RECORD_SHAPES,
+    PROFILER_TRACE_PROFILE_MEMORY,
+    PROFILER_TRACE_WITH_STACK
+)
+
+
+class TraceProfiler(Module):
+    def __init__(self,
+                 folder: str = PROFILER_TRACE_FOLDER,
+                 loader_name: str = PROFILER_TRACE_LOADER_NAME,
+                 wait: int = PROFILER_TRACE_WAIT,
+                 warmup: int = PROFILER_TRACE_WARMUP,
+                 active: int = PROFILER_TRACE_ACTIVE,
+                 repeat: int = PROFILER_TRACE_REPEAT,
+                 skip_first: int = PROFILER_TRACE_SKIP_FIRST,
+                 row_limit: int = PROFILER_TRACE_ROW_LIMIT,
+                 sort_by: Optional[str] = PROFILER_TRACE_SORT_BY,
+                 record_shapes: bool = PROFILER_TRACE_RECORD_SHAPES,
+                 profile_memory: bool = PROFILER_TRACE_PROFILE_MEMORY,
+                 with_stack: bool = PROFILER_TRACE_WITH_STACK,
+                 ):
+        super().__init__()
+
+        try:
+            # imported here, so the package itself keeps working on torch versions without torch.profiler
+            from torch.profiler import ProfilerActivity, profile, schedule
+        except ImportError:
+            raise RuntimeError(f"TraceProfiler needs torch.profiler (torch>=1.8.1), "
+                               f"torch {torch.__version__} is installed")
+
+        self._profile = profile
+        self._activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            self._activities.append(ProfilerActivity.CUDA)
+
+        self._folder = folder
+        os.makedirs(self._folder, exist_ok=True)
+
+        self._loader_name = loader_name
+        self._schedule = schedule(wait=wait, warmup=warmup, active=active, repeat=repeat, skip_first=skip_first)
+        # steps after which the schedule has nothing left to record, the profiler is stopped there
+        self._total_steps = skip_first + repeat * (wait + warmup + active) if repeat > 0 else None
+
+        self._row_limit = row_limit
+        self._sort_by = sort_by or ("self_cuda_time_total" if torch.cuda.is_available() else "self_cpu_time_total")
+        self._record_shapes = record_shapes
+        self._profile_memory = profile_memory
+        self._with_stack = with_stack
+
+        self._profiler: Optional[Any] = None
+        self._steps = 0
+        self._done = False
+
+        (
+            self.sub(RunnerStartEvent, self.handle_runner_start)
+                .sub(LoaderProcessBatchStartEvent, self.handle_process_batch_start)
+                .sub(LoaderProcessBatchEndEvent, self.handle_process_batch_end)
+                .sub(RunnerEndEvent, self.handle_runner_end)
+        )
+
+    def handle_runner_start(self, event: RunnerStartEvent):
+        # every run of the runner is profiled on its own schedule
+        self._steps = 0
+        self._done = False
+
+    def handle_process_batch_start(self, event: LoaderProcessBatchStartEvent):
+        if self._done or self._profiler is not None or event.loader.name != self._loader_name:
+            return
+
+        self._profiler = self._profile(activities=self._activities,
+                                       schedule=self._schedule,
+                                       on_trace_ready=self._export,
+                                       record_shapes=self._record_shapes,
+                                       profile_memory=self._profile_memory,
+                                       with_stack=self._with_stack)
+        self._profiler.start()
+
+    def handle_process_batch_end(self, event: LoaderProcessBatchEndEvent):
+        if self._profiler is None or event.loader.name != self._loader_name:
+            return
+
+        self._profiler.step()
+        self._steps += 1
+
+        if self._total_steps is not None and self._steps >= self._total_steps:
+            self.close()
+
+    def handle_runner_end(self, event: RunnerEndEvent):
+        self.close()
+
+    def close(self):
+        if self._profiler is None:
+            return
+
+        # stopping inside an active window exports what was recorded so far
+        self._profiler.stop()
+        self._profiler = None
+        self._done = True
+
+    def _export(self, profiler: Any):
+        filename = f"rank{get_rank()}_step{profiler.step_num:0>6}"
+
+        profiler.export_chrome_trace(os.path.join(self._folder, f"{filename}_trace.json"))
+
+        table = profiler.key_averages().table(sort_by=self._sort_by, row_limit=self._row_limit)
+        with open(os.path.join(self._folder, f"{filename}_summary.txt"), "w", encoding="utf-8") as file:
+            file.write(table)
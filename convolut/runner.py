@@ -1,7 +1,8 @@
 from dataclasses import dataclass
-from typing import List, Dict, Union, Optional
+from typing import Any, List, Dict, Union, Optional
 
-from decouple import Event, Mediator, Module
+import torch.distributed as dist
+from decouple import Event, Mediator, Module, Registry
 
 from .epoch import Epoch
 from .events import RunnerForceStopEvent, EpochForceStopEvent
@@ -9,7 +10,9 @@ from .loader import Loader
 from .settings import (
     RUNNER_EPOCHS,
     RUNNER_STEPS_PER_EPOCH,
-    RUNNER_RESTART_ITERATOR
+    RUNNER_RESTART_ITERATOR,
+    RUNNER_DISTRIBUTED,
+    RUNNER_DISTRIBUTED_BACKEND
 )
 
 
@@ -20,13 +23,20 @@ class Runner(Module):
                  epochs: int = RUNNER_EPOCHS,
                  steps_per_epoch: Optional[int] = RUNNER_STEPS_PER_EPOCH,
                  restart_iterator: Optional[bool] = RUNNER_RESTART_ITERATOR,
-                 mediator: Mediator = Mediator()
+                 distributed: bool = RUNNER_DISTRIBUTED,
+                 distributed_backend: str = RUNNER_DISTRIBUTED_BACKEND,
+                 mediator: Optional[Mediator] = None
                  ):
-        super().__init__(mediator)
+        # a default instance would be shared, with its subscriptions, by every runner created without one
+        super().__init__(mediator if mediator is not None else Mediator(Registry()))
 
         self._loaders = loaders
         self._restart_iterator = restart_iterator
 
+        self._distributed = distributed
+        self._distributed_backend = distributed_backend
+        self._owns_process_group = False
+
         epochs_limit = 0
         if isinstance(self._loaders, dict):
             epochs_limit = max([epochs_limit] + list(self._loaders.keys()))
@@ -59,7 +69,32 @@ class Runner(Module):
 
         return epoch
 
+    def state_dict(self) -> Dict[str, Any]:
+        return {
+            "epoch_index": self.current_epoch_index,
+            "loaders": {loader.name: loader.state_dict() for loader in self._all_loaders()},
+        }
+
+    def load_state_dict(self, state: Dict[str, Any]):
+        for loader in self._all_loaders():
+            if loader.name in state["loaders"]:
+                loader.load_state_dict(state["loaders"][loader.name])
+
+    def _all_loaders(self) -> List[Loader]:
+        if isinstance(self._loaders, dict):
+            loaders = [loader for key in sorted(self._loaders.keys()) for loader in self._loaders[key]]
+        else:
+            loaders = list(self._loaders)
+
+        # the same loader may serve several epoch ranges
+        return list({id(loader): loader for loader in loaders}.values())
+
     def start(self):
+        if self._distributed and not dist.is_initialized():
+            # rank, world size and rendezvous are read from the environment (torchrun, RANK/WORLD_SIZE/...)
+            dist.init_process_group(backend=self._distributed_backend)
+            self._owns_process_group = True
+
         self.pub(RunnerStartEvent(runner=self))
 
         self._runner_on = True
@@ -84,6 +119,13 @@ class Runner(Module):
         self._runner_on = False
         self.pub(RunnerEndEvent(runner=self))
 
+        for loader in self._all_loaders():
+            loader.close()
+
+        if self._owns_process_group and dist.is_initialized():
+            dist.destroy_process_group()
+            self._owns_process_group = False
+
     def preprocess_epoch(self, epoch: Epoch):
         self.pub(RunnerPreprocessEpochEvent(runner=self, epoch=epoch))
 
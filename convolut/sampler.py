@@ -0,0 +1,46 @@
+from typing import Any, Dict, Iterator, Sized
+
+import torch
+from torch.utils.data import Sampler
+
+from .settings import LOADER_SAMPLER_SEED
+
+
+class ResumableSampler(Sampler):
+    # every pass draws its permutation from (seed, pass), so a resumed pass can seek instead of replaying batches
+    def __init__(self, data_source: Sized, shuffle: bool = True, seed: int = LOADER_SAMPLER_SEED):
+        self._data_source = data_source
+        self._shuffle = shuffle
+        self._seed = seed
+
+        self._pass = -1
+        self._start = 0
+
+    def __len__(self) -> int:
+        return len(self._data_source)
+
+    def __iter__(self) -> Iterator[int]:
+        self._pass += 1
+        start, self._start = self._start, 0
+
+        size = len(self._data_source)
+
+        if self._shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self._seed + self._pass)
+            indices = torch.randperm(size, generator=generator)[start:].tolist()
+        else:
+            indices = range(start, size)
+
+        return iter(indices)
+
+    def seek(self, index: int):
+        # the next pass repeats the current one, starting at the given sample
+        self._pass -= 1
+        self._start = index
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {"pass": self._pass}
+
+    def load_state_dict(self, state: Dict[str, Any]):
+        self._pass = state["pass"]
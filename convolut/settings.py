@@ -1,5 +1,8 @@
 import os
-from .constants import ConsoleMode, FlushType, LoaderName, ScheduleType, StateMode
+from .constants import (
+    Activation, ConsoleMode, DiceReduction, FlushType, LoaderName, LogFormat, MetricMode, ReduceType, ScheduleType,
+    StateMode
+)
 
 GLOBAL_PREFIX = "CONVOLUT_"
 
@@ -12,29 +15,149 @@ if CRITERION_BCEDICE_THRESHOLD:
 
 CRITERION_BCEDICE_BCE_WEIGHT = float(os.environ.get(f"{GLOBAL_PREFIX}CRITERION_BCEDICE_BCE_WEIGHT", 0.5))
 CRITERION_BCEDICE_DICE_WEIGHT = float(os.environ.get(f"{GLOBAL_PREFIX}CRITERION_BCEDICE_DICE_WEIGHT", 0.5))
+CRITERION_BCEDICE_REDUCTION = os.environ.get(f"{GLOBAL_PREFIX}CRITERION_BCEDICE_REDUCTION", DiceReduction.Micro)
 
 CRITERION_DICE_EPS = float(os.environ.get(f"{GLOBAL_PREFIX}CRITERION_DICE_EPS", 1e-7))
 CRITERION_DICE_THRESHOLD = os.environ.get(f"{GLOBAL_PREFIX}CRITERION_DICE_THRESHOLD", None)
 if CRITERION_DICE_THRESHOLD:
     CRITERION_DICE_THRESHOLD = float(CRITERION_DICE_THRESHOLD)
+CRITERION_DICE_ACTIVATION = os.environ.get(f"{GLOBAL_PREFIX}CRITERION_DICE_ACTIVATION", Activation.Sigmoid)
+CRITERION_DICE_REDUCTION = os.environ.get(f"{GLOBAL_PREFIX}CRITERION_DICE_REDUCTION", DiceReduction.Micro)
+
+# LOADER
+LOADER_PREFETCH = int(os.environ.get(f"{GLOBAL_PREFIX}LOADER_PREFETCH", 0))
+
+# None shards automatically when running distributed
+LOADER_SHARD = os.environ.get(f"{GLOBAL_PREFIX}LOADER_SHARD", None)
+if LOADER_SHARD:
+    LOADER_SHARD = LOADER_SHARD.lower() in ["true", "yes", "1"]
+LOADER_SAMPLER_SEED = int(os.environ.get(f"{GLOBAL_PREFIX}LOADER_SAMPLER_SEED", 0))
 
 # LOGGER
 LOGGER_CONSOLE_MODE = os.environ.get(f"{GLOBAL_PREFIX}LOGGER_CONSOLE_MODE", ConsoleMode.SingleLine)
+LOGGER_CONSOLE_REFRESH_INTERVAL_MS = int(os.environ.get(f"{GLOBAL_PREFIX}LOGGER_CONSOLE_REFRESH_INTERVAL_MS", 100))
+# used when stdout is not a terminal or in the basic mode, every redraw is a new line there
+LOGGER_CONSOLE_PLAIN_INTERVAL_MS = int(os.environ.get(f"{GLOBAL_PREFIX}LOGGER_CONSOLE_PLAIN_INTERVAL_MS", 30000))
 
 LOGGER_FILE_FOLDER = os.environ.get(f"{GLOBAL_PREFIX}LOGGER_FILE_FOLDER", "logs/file")
 LOGGER_FILE_FILENAME = os.environ.get(f"{GLOBAL_PREFIX}LOGGER_FILE_FILENAME", "log.txt")
+LOGGER_FILE_FORMAT = os.environ.get(f"{GLOBAL_PREFIX}LOGGER_FILE_FORMAT", LogFormat.Text)
+LOGGER_FILE_FLUSH_INTERVAL = float(os.environ.get(f"{GLOBAL_PREFIX}LOGGER_FILE_FLUSH_INTERVAL", 1.0))
+LOGGER_FILE_BUFFER_SIZE = int(os.environ.get(f"{GLOBAL_PREFIX}LOGGER_FILE_BUFFER_SIZE", 1000))
 
 # METRIC
 METRIC_MANAGER_FLUSH_TYPE = os.environ.get(f"{GLOBAL_PREFIX}METRIC_MANAGER_FLUSH_TYPE", FlushType.PerEpoch)
+METRIC_MANAGER_REDUCE_TYPE = os.environ.get(f"{GLOBAL_PREFIX}METRIC_MANAGER_REDUCE_TYPE", ReduceType.Mean)
+METRIC_MANAGER_EMA_ALPHA = float(os.environ.get(f"{GLOBAL_PREFIX}METRIC_MANAGER_EMA_ALPHA", 0.1))
+
+# a sampling policy of metric modules, by default every batch of every loader is evaluated
+METRIC_SAMPLING_EVERY_N_STEPS = int(os.environ.get(f"{GLOBAL_PREFIX}METRIC_SAMPLING_EVERY_N_STEPS", 1))
+METRIC_SAMPLING_FRACTION = float(os.environ.get(f"{GLOBAL_PREFIX}METRIC_SAMPLING_FRACTION", 1.0))
+METRIC_SAMPLING_LOADER_NAMES = os.environ.get(f"{GLOBAL_PREFIX}METRIC_SAMPLING_LOADER_NAMES", None)
+if METRIC_SAMPLING_LOADER_NAMES:
+    METRIC_SAMPLING_LOADER_NAMES = METRIC_SAMPLING_LOADER_NAMES.split(",")
+METRIC_SAMPLING_LAST_K_STEPS = int(os.environ.get(f"{GLOBAL_PREFIX}METRIC_SAMPLING_LAST_K_STEPS", 0))
+METRIC_SAMPLING_SEED = int(os.environ.get(f"{GLOBAL_PREFIX}METRIC_SAMPLING_SEED", 0))
+
+METRIC_TIMING_SYNCHRONIZE = os.environ.get(f"{GLOBAL_PREFIX}METRIC_TIMING_SYNCHRONIZE", "false").lower() in [
+    "true", "yes", "1"]
+METRIC_TIMING_PERCENTILES = [int(percentile) for percentile in
+                             os.environ.get(f"{GLOBAL_PREFIX}METRIC_TIMING_PERCENTILES", "50,90,99").split(",")]
+METRIC_TIMING_RESERVOIR_SIZE = int(os.environ.get(f"{GLOBAL_PREFIX}METRIC_TIMING_RESERVOIR_SIZE", 1024))
+
+METRIC_CONFUSION_NUM_CLASSES = os.environ.get(f"{GLOBAL_PREFIX}METRIC_CONFUSION_NUM_CLASSES", None)
+if METRIC_CONFUSION_NUM_CLASSES:
+    METRIC_CONFUSION_NUM_CLASSES = int(METRIC_CONFUSION_NUM_CLASSES)
+METRIC_CONFUSION_THRESHOLD = float(os.environ.get(f"{GLOBAL_PREFIX}METRIC_CONFUSION_THRESHOLD", 0.5))
+METRIC_CONFUSION_IGNORE_INDEX = os.environ.get(f"{GLOBAL_PREFIX}METRIC_CONFUSION_IGNORE_INDEX", None)
+if METRIC_CONFUSION_IGNORE_INDEX:
+    METRIC_CONFUSION_IGNORE_INDEX = int(METRIC_CONFUSION_IGNORE_INDEX)
+METRIC_CONFUSION_PREFIX = os.environ.get(f"{GLOBAL_PREFIX}METRIC_CONFUSION_PREFIX", "cm")
+METRIC_CONFUSION_PER_CLASS = os.environ.get(f"{GLOBAL_PREFIX}METRIC_CONFUSION_PER_CLASS", "false").lower() in [
+    "true", "yes", "1"]
+
+METRIC_DICE_THRESHOLD = os.environ.get(f"{GLOBAL_PREFIX}METRIC_DICE_THRESHOLD", None)
+if METRIC_DICE_THRESHOLD:
+    METRIC_DICE_THRESHOLD = float(METRIC_DICE_THRESHOLD)
+METRIC_DICE_ACTIVATION = os.environ.get(f"{GLOBAL_PREFIX}METRIC_DICE_ACTIVATION", Activation.Sigmoid)
+METRIC_DICE_REDUCTION = os.environ.get(f"{GLOBAL_PREFIX}METRIC_DICE_REDUCTION", DiceReduction.Micro)
+# also publishes dice.class_{index} for every class
+METRIC_DICE_PER_CLASS = os.environ.get(f"{GLOBAL_PREFIX}METRIC_DICE_PER_CLASS", "false").lower() in [
+    "true", "yes", "1"]
+
+METRIC_MEMORY_EVERY_STEPS = int(os.environ.get(f"{GLOBAL_PREFIX}METRIC_MEMORY_EVERY_STEPS", 1))
+METRIC_MEMORY_TRACEMALLOC = os.environ.get(f"{GLOBAL_PREFIX}METRIC_MEMORY_TRACEMALLOC", "false").lower() in [
+    "true", "yes", "1"]
+METRIC_MEMORY_THRESHOLD_MB = os.environ.get(f"{GLOBAL_PREFIX}METRIC_MEMORY_THRESHOLD_MB", None)
+if METRIC_MEMORY_THRESHOLD_MB:
+    METRIC_MEMORY_THRESHOLD_MB = float(METRIC_MEMORY_THRESHOLD_MB)
+# rss, allocated, reserved or traced
+METRIC_MEMORY_THRESHOLD_STAT = os.environ.get(f"{GLOBAL_PREFIX}METRIC_MEMORY_THRESHOLD_STAT", "rss")
 
 # MODEL
 MODEL_MANAGER_SCHEDULE_TYPE = os.environ.get(f"{GLOBAL_PREFIX}MODEL_MANAGER_SCHEDULE_TYPE", ScheduleType.PerEpoch)
+MODEL_MANAGER_NON_BLOCKING = os.environ.get(f"{GLOBAL_PREFIX}MODEL_MANAGER_NON_BLOCKING", "false").lower() in [
+    "true", "yes", "1"]
+MODEL_MANAGER_AMP = os.environ.get(f"{GLOBAL_PREFIX}MODEL_MANAGER_AMP", "false").lower() in ["true", "yes", "1"]
+MODEL_MANAGER_AMP_DTYPE = os.environ.get(f"{GLOBAL_PREFIX}MODEL_MANAGER_AMP_DTYPE", None)
+MODEL_MANAGER_COMPILE_MODE = os.environ.get(f"{GLOBAL_PREFIX}MODEL_MANAGER_COMPILE_MODE", None)
+MODEL_MANAGER_ACCUMULATE_STEPS = int(os.environ.get(f"{GLOBAL_PREFIX}MODEL_MANAGER_ACCUMULATE_STEPS", 1))
+MODEL_MANAGER_MICRO_BATCH_SIZE = os.environ.get(f"{GLOBAL_PREFIX}MODEL_MANAGER_MICRO_BATCH_SIZE", None)
+if MODEL_MANAGER_MICRO_BATCH_SIZE:
+    MODEL_MANAGER_MICRO_BATCH_SIZE = int(MODEL_MANAGER_MICRO_BATCH_SIZE)
+
+MODEL_INFER_MANAGER_BATCH_SIZE = os.environ.get(f"{GLOBAL_PREFIX}MODEL_INFER_MANAGER_BATCH_SIZE", None)
+if MODEL_INFER_MANAGER_BATCH_SIZE:
+    MODEL_INFER_MANAGER_BATCH_SIZE = int(MODEL_INFER_MANAGER_BATCH_SIZE)
+
+MODEL_SINK_FOLDER = os.environ.get(f"{GLOBAL_PREFIX}MODEL_SINK_FOLDER", "logs/predictions")
+MODEL_SINK_PREFIX = os.environ.get(f"{GLOBAL_PREFIX}MODEL_SINK_PREFIX", "predictions")
+MODEL_SINK_CHUNK_SIZE = int(os.environ.get(f"{GLOBAL_PREFIX}MODEL_SINK_CHUNK_SIZE", 1024))
+
+# PROFILER
+# read by training scripts that add a TraceProfiler on demand, see examples/simple/base.py
+PROFILER_TRACE_ENABLED = os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_ENABLED", "false").lower() in [
+    "true", "yes", "1"]
+PROFILER_TRACE_FOLDER = os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_FOLDER", "logs/profiler")
+PROFILER_TRACE_LOADER_NAME = os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_LOADER_NAME", LoaderName.Train)
+PROFILER_TRACE_WAIT = int(os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_WAIT", 5))
+PROFILER_TRACE_WARMUP = int(os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_WARMUP", 2))
+PROFILER_TRACE_ACTIVE = int(os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_ACTIVE", 5))
+PROFILER_TRACE_REPEAT = int(os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_REPEAT", 1))
+PROFILER_TRACE_SKIP_FIRST = int(os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_SKIP_FIRST", 0))
+PROFILER_TRACE_ROW_LIMIT = int(os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_ROW_LIMIT", 20))
+# None sorts by self device time when cuda is available, by self cpu time otherwise
+PROFILER_TRACE_SORT_BY = os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_SORT_BY", None)
+PROFILER_TRACE_RECORD_SHAPES = os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_RECORD_SHAPES", "false").lower() in [
+    "true", "yes", "1"]
+PROFILER_TRACE_PROFILE_MEMORY = os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_PROFILE_MEMORY", "false").lower() in [
+    "true", "yes", "1"]
+PROFILER_TRACE_WITH_STACK = os.environ.get(f"{GLOBAL_PREFIX}PROFILER_TRACE_WITH_STACK", "false").lower() in [
+    "true", "yes", "1"]
 
 # STATE
 STATE_FILE_CHECKPOINT_FOLDER = os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_FOLDER", "logs/checkpoints")
 STATE_FILE_CHECKPOINT_SUFFIX = os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_SUFFIX", "_checkpoint.pth")
+STATE_FILE_CHECKPOINT_ASYNC = os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_ASYNC", "false").lower() in [
+    "true", "yes", "1"]
+STATE_FILE_CHECKPOINT_MMAP = os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_MMAP", "false").lower() in [
+    "true", "yes", "1"]
+STATE_FILE_CHECKPOINT_MAP_LOCATION = os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_MAP_LOCATION", None)
+STATE_FILE_CHECKPOINT_KEEP_LAST = int(os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_KEEP_LAST", 0))
+STATE_FILE_CHECKPOINT_KEEP_TOP_K = int(os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_KEEP_TOP_K", 0))
+STATE_FILE_CHECKPOINT_METRIC_NAME = os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_METRIC_NAME", "loss")
+STATE_FILE_CHECKPOINT_LOADER_NAME = os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_LOADER_NAME",
+                                                   LoaderName.Valid)
+STATE_FILE_CHECKPOINT_METRIC_MODE = os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_METRIC_MODE",
+                                                   MetricMode.Min)
+STATE_FILE_CHECKPOINT_INDEX_FILENAME = os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_INDEX_FILENAME",
+                                                      "index.json")
+STATE_FILE_CHECKPOINT_DELTA = os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_DELTA", "false").lower() in [
+    "true", "yes", "1"]
+STATE_FILE_CHECKPOINT_COMPACT_EVERY = int(os.environ.get(f"{GLOBAL_PREFIX}STATE_FILE_CHECKPOINT_COMPACT_EVERY", 10))
 
 STATE_MANAGER_STATE_MODE = os.environ.get(f"{GLOBAL_PREFIX}STATE_MANAGER_STATE_MODE", StateMode.Last)
+STATE_MANAGER_SAVE_EVERY_STEPS = int(os.environ.get(f"{GLOBAL_PREFIX}STATE_MANAGER_SAVE_EVERY_STEPS", 0))
 
 # TRIGGER
 TRIGGER_EARLY_STOPPER_WINDOW = int(os.environ.get(f"{GLOBAL_PREFIX}TRIGGER_EARLY_STOPPER_WINDOW", 3))
@@ -52,3 +175,6 @@ if RUNNER_STEPS_PER_EPOCH:
 RUNNER_RESTART_ITERATOR = os.environ.get(f"{GLOBAL_PREFIX}RUNNER_RESTART_ITERATOR", None)
 if RUNNER_RESTART_ITERATOR:
     RUNNER_RESTART_ITERATOR = RUNNER_RESTART_ITERATOR.lower() in ["true", "yes", "1"]
+
+RUNNER_DISTRIBUTED = os.environ.get(f"{GLOBAL_PREFIX}RUNNER_DISTRIBUTED", "false").lower() in ["true", "yes", "1"]
+RUNNER_DISTRIBUTED_BACKEND = os.environ.get(f"{GLOBAL_PREFIX}RUNNER_DISTRIBUTED_BACKEND", "gloo")
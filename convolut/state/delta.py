@@ -0,0 +1,78 @@
+import hashlib
+from typing import Any, Dict, Tuple
+
+import torch
+
+SNAPSHOT_ID_KEY = "_snapshot_id"
+BASE_SNAPSHOT_ID_KEY = "_base_snapshot_id"
+# stands in for a tensor of a delta that is unchanged since the full snapshot
+BASE_TENSOR = "_base_tensor"
+
+Path = Tuple[Any, ...]
+
+
+def digest(tensor: torch.Tensor) -> str:
+    tensor = tensor.detach().cpu().contiguous()
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f'{tensor.dtype}{tuple(tensor.shape)}'.encode("utf-8"))
+    hasher.update(tensor.reshape(-1).view(torch.uint8).numpy())
+
+    return hasher.hexdigest()
+
+
+def digests(state: Any, path: Path = ()) -> Dict[Path, str]:
+    if isinstance(state, torch.Tensor):
+        return {path: digest(state)}
+
+    result = {}
+    for key, value in _children(state):
+        result.update(digests(value, path + (key,)))
+
+    return result
+
+
+def make_delta(state: Any, base_digests: Dict[Path, str], path: Path = ()) -> Any:
+    # same structure as the state, tensors unchanged since the full snapshot are replaced with BASE_TENSOR
+    if isinstance(state, torch.Tensor):
+        return BASE_TENSOR if base_digests.get(path) == digest(state) else state
+
+    if isinstance(state, dict):
+        return type(state)((key, make_delta(value, base_digests, path + (key,))) for key, value in state.items())
+
+    if isinstance(state, (list, tuple)) and not hasattr(state, "_fields"):
+        return type(state)(make_delta(value, base_digests, path + (key,)) for key, value in enumerate(state))
+
+    return state
+
+
+def apply_delta(base: Any, delta: Any) -> Any:
+    if isinstance(delta, str) and delta == BASE_TENSOR:
+        return base
+
+    if isinstance(delta, dict):
+        return type(delta)((key, apply_delta(_child(base, key), value)) for key, value in delta.items())
+
+    if isinstance(delta, (list, tuple)) and not hasattr(delta, "_fields"):
+        return type(delta)(apply_delta(_child(base, key), value) for key, value in enumerate(delta))
+
+    return delta
+
+
+def _children(state: Any):
+    if isinstance(state, dict):
+        return state.items()
+
+    if isinstance(state, (list, tuple)) and not hasattr(state, "_fields"):
+        return enumerate(state)
+
+    return ()
+
+
+def _child(base: Any, key: Any) -> Any:
+    if isinstance(base, dict):
+        return base.get(key)
+
+    if isinstance(base, (list, tuple)) and key < len(base):
+        return base[key]
+
+    return None
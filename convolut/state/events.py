@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 from decouple import Event
 
@@ -8,16 +8,23 @@ from decouple import Event
 class StateSaveEvent(Event):
     state: Dict[str, Any] = None
     state_type: str = None
+    # saved every N steps inside an unfinished epoch, it only replaces the last checkpoint
+    step_save: bool = False
 
 
 @dataclass
 class StateLoadEvent(Event):
     state_type: str = None
+    # None loads the whole state
+    keys: List[str] = None
+    # set to resume from an entry of the checkpoint index instead of the state_type file
+    epoch_index: int = None
 
 
 @dataclass
 class CheckpointLoadingEvent(Event):
     checkpoint_type: str = None
+    keys: List[str] = None
 
 
 @dataclass
@@ -35,3 +42,5 @@ class CheckpointSavingEvent(Event):
 @dataclass
 class CheckpointSavedEvent(Event):
     checkpoint_type: str = None
+    # seconds spent writing this file, measured where it is written (the writer thread when asynchronous)
+    duration: Optional[float] = None
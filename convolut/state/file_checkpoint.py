@@ -1,5 +1,8 @@
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import inspect
 import os
+import time
+import uuid
 import torch
 from decouple import Module
 from .events import (
@@ -10,15 +13,46 @@ from .events import (
     StateSaveEvent,
     StateLoadEvent
 )
+from .delta import SNAPSHOT_ID_KEY, BASE_SNAPSHOT_ID_KEY, apply_delta, digests, make_delta
+from .index import CheckpointIndex
+from .writer import CheckpointWriter, atomic_save, atomic_save_json, remove, remove_stale, snapshot
 from ..constants import StateMode
-from ..settings import STATE_FILE_CHECKPOINT_FOLDER, STATE_FILE_CHECKPOINT_SUFFIX
+from ..distributed import is_main_process
+from ..metric.metric_manager import MetricManagerFlushEvent
+from ..runner import RunnerStartEvent, RunnerEndEvent
+from ..settings import (
+    STATE_FILE_CHECKPOINT_FOLDER,
+    STATE_FILE_CHECKPOINT_SUFFIX,
+    STATE_FILE_CHECKPOINT_ASYNC,
+    STATE_FILE_CHECKPOINT_MMAP,
+    STATE_FILE_CHECKPOINT_MAP_LOCATION,
+    STATE_FILE_CHECKPOINT_KEEP_LAST,
+    STATE_FILE_CHECKPOINT_KEEP_TOP_K,
+    STATE_FILE_CHECKPOINT_METRIC_NAME,
+    STATE_FILE_CHECKPOINT_LOADER_NAME,
+    STATE_FILE_CHECKPOINT_METRIC_MODE,
+    STATE_FILE_CHECKPOINT_INDEX_FILENAME,
+    STATE_FILE_CHECKPOINT_DELTA,
+    STATE_FILE_CHECKPOINT_COMPACT_EVERY
+)
 
 
 class FileCheckpoint(Module):
     def __init__(
             self,
             folder: str = STATE_FILE_CHECKPOINT_FOLDER,
-            suffix: str = STATE_FILE_CHECKPOINT_SUFFIX
+            suffix: str = STATE_FILE_CHECKPOINT_SUFFIX,
+            asynchronous: bool = STATE_FILE_CHECKPOINT_ASYNC,
+            mmap: bool = STATE_FILE_CHECKPOINT_MMAP,
+            map_location=STATE_FILE_CHECKPOINT_MAP_LOCATION,
+            keep_last: int = STATE_FILE_CHECKPOINT_KEEP_LAST,
+            keep_top_k: int = STATE_FILE_CHECKPOINT_KEEP_TOP_K,
+            metric_name: str = STATE_FILE_CHECKPOINT_METRIC_NAME,
+            loader_name: str = STATE_FILE_CHECKPOINT_LOADER_NAME,
+            metric_mode: str = STATE_FILE_CHECKPOINT_METRIC_MODE,
+            index_filename: str = STATE_FILE_CHECKPOINT_INDEX_FILENAME,
+            delta: bool = STATE_FILE_CHECKPOINT_DELTA,
+            compact_every: int = STATE_FILE_CHECKPOINT_COMPACT_EVERY,
     ):
         super().__init__()
         self._folder = folder
@@ -31,28 +65,101 @@ class FileCheckpoint(Module):
         }
 
         self._filepaths = {}
+        self._writer = CheckpointWriter() if asynchronous else None
+        if mmap and not _supports_mmap():
+            raise RuntimeError(f"mmap checkpoint loading needs torch>=2.1, torch {torch.__version__} is installed")
+
+        self._mmap = mmap
+        self._map_location = map_location
 
         for key, filename in self._filenames.items():
             self._filepaths[key] = os.path.join(self._folder, filename)
 
+        # every epoch is kept as a separate file when retention is on, evicted ones are deleted by the writer
+        self._keep_last = keep_last
+        self._keep_top_k = keep_top_k
+        self._metric_name = metric_name
+        self._loader_name = loader_name
+        self._metric_mode = metric_mode
+        self._index = CheckpointIndex(os.path.join(self._folder, index_filename))
+        self._metrics: Dict[str, Dict[int, Dict[str, float]]] = {}
+
+        # between full snapshots only tensors whose digest changed are written to a {type}_delta file
+        self._delta = delta
+        self._compact_every = compact_every
+        self._delta_saves: Dict[str, int] = {}
+        # checkpoint_type -> (snapshot_id, digests) of the last full snapshot, used on the writer thread only
+        self._bases: Dict[str, Tuple[str, Dict[Tuple, str]]] = {}
+
         (
             self.sub(StateSaveEvent, self.handle_state_save)
                 .sub(StateLoadEvent, self.handle_state_load)
+                .sub(MetricManagerFlushEvent, self.handle_metric_manager_flush)
+                .sub(RunnerStartEvent, self.handle_runner_start)
+                .sub(RunnerEndEvent, self.handle_runner_end)
         )
 
+    @property
+    def retention(self) -> bool:
+        return self._keep_last > 0 or self._keep_top_k > 0
+
     def handle_state_save(self, event: StateSaveEvent):
+        # every process holds the same state, only the main one writes it
+        if not is_main_process():
+            return
+
         filepath = self._checkpoint_path(event.state_type)
 
-        self._save_checkpoint(checkpoint=event.state,
+        # one host copy of the state serves both the checkpoint and its retained epoch copy
+        state = snapshot(event.state) if self._writer is not None else event.state
+
+        self._save_checkpoint(checkpoint=state,
                               checkpoint_type=event.state_type,
                               filepath=filepath)
 
+        # epoch copies and the index hold finished epochs only, step saves would overwrite them with a partial one
+        if self.retention and event.state_type == StateMode.Last and not event.step_save:
+            self._retain(checkpoint=state, epoch_index=state["epoch_index"])
+
+    def handle_metric_manager_flush(self, event: MetricManagerFlushEvent):
+        self._metrics = event.metrics
+
+        if self.retention and is_main_process():
+            self._index.update(self._metrics)
+            self._evict()
+
     def handle_state_load(self, event: StateLoadEvent):
         filepath = self._checkpoint_path(event.state_type)
 
+        if event.epoch_index is not None:
+            entry = self._index.get(event.epoch_index)
+
+            if entry is None:
+                raise ValueError(f'epoch_index:{event.epoch_index} is not in the checkpoint index')
+
+            filepath = os.path.join(self._folder, entry["filename"])
+
+        if self._writer is not None:
+            self._writer.flush()
+            self._publish_saved()
+
         if os.path.exists(filepath):
             self._load_checkpoint(checkpoint_type=event.state_type,
-                                  filepath=filepath)
+                                  filepath=filepath,
+                                  keys=event.keys,
+                                  delta_filepath=None if event.epoch_index is not None
+                                  else self._delta_path(event.state_type))
+
+    def handle_runner_start(self, event: RunnerStartEvent):
+        if is_main_process():
+            remove_stale(self._folder)
+
+    def handle_runner_end(self, event: RunnerEndEvent):
+        if self._writer is None:
+            return
+
+        self._writer.close()
+        self._publish_saved()
 
     def _checkpoint_path(self, checkpoint_type: str) -> str:
         if checkpoint_type not in self._filenames:
@@ -63,16 +170,155 @@ class FileCheckpoint(Module):
 
         return filepath
 
+    def _delta_path(self, checkpoint_type: str) -> str:
+        return os.path.join(self._folder, f'{checkpoint_type}_delta{self._suffix}')
+
+    def _retain(self, checkpoint: Dict[str, Any], epoch_index: int):
+        filename = f'epoch_{epoch_index:04d}{self._suffix}'
+        filepath = os.path.join(self._folder, filename)
+
+        if self._writer is None:
+            atomic_save(checkpoint, filepath)
+        else:
+            self._writer.submit(checkpoint=checkpoint, checkpoint_type=None, filepath=filepath)
+
+        self._index.add(epoch_index=epoch_index, filename=filename, metrics=self._metrics)
+        self._evict()
+
+    def _evict(self):
+        evicted = self._index.evict(keep_last=self._keep_last,
+                                    keep_top_k=self._keep_top_k,
+                                    metric_name=self._metric_name,
+                                    loader_name=self._loader_name,
+                                    metric_mode=self._metric_mode)
+
+        # the writer runs operations in order, so files are deleted and the index replaced after pending saves
+        for entry in evicted:
+            filepath = os.path.join(self._folder, entry["filename"])
+
+            if self._writer is None:
+                remove(filepath)
+            else:
+                self._writer.remove(filepath)
+
+        if self._writer is None:
+            atomic_save_json(self._index.to_dict(), self._index.filepath)
+        else:
+            self._writer.submit_json(self._index.to_dict(), self._index.filepath)
+
     def _save_checkpoint(self, checkpoint: Dict[str, Any], checkpoint_type: str, filepath: str):
         self.pub(CheckpointSavingEvent(checkpoint=checkpoint, checkpoint_type=checkpoint_type))
 
-        torch.save(checkpoint, filepath)
+        filepath, operation = self._save_operation(checkpoint, checkpoint_type, filepath)
+
+        if self._writer is None:
+            started = time.perf_counter()
+            operation()
+            self.pub(CheckpointSavedEvent(checkpoint_type=checkpoint_type, duration=time.perf_counter() - started))
+            return
 
-        self.pub(CheckpointSavedEvent(checkpoint_type=checkpoint_type))
+        # the state is copied to the host already, serialization runs on the writer thread
+        self._writer.queue(filepath, operation, checkpoint_type)
+        self._publish_saved()
 
-    def _load_checkpoint(self, checkpoint_type: str, filepath: str):
-        self.pub(CheckpointLoadingEvent(checkpoint_type=checkpoint_type))
+    def _save_operation(self,
+                        checkpoint: Dict[str, Any],
+                        checkpoint_type: str,
+                        filepath: str) -> Tuple[str, Callable[[], None]]:
+        if not self._delta:
+            return filepath, lambda: atomic_save(checkpoint, filepath)
 
-        checkpoint = torch.load(filepath)
+        delta_filepath = self._delta_path(checkpoint_type)
+        saves = self._delta_saves.get(checkpoint_type)
+
+        if saves is None or saves >= self._compact_every:
+            self._delta_saves[checkpoint_type] = 0
+            return filepath, lambda: self._save_full(checkpoint, checkpoint_type, filepath, delta_filepath)
+
+        self._delta_saves[checkpoint_type] = saves + 1
+        return delta_filepath, lambda: self._save_delta(checkpoint, checkpoint_type, filepath, delta_filepath)
+
+    def _save_full(self, checkpoint: Dict[str, Any], checkpoint_type: str, filepath: str, delta_filepath: str):
+        snapshot_id = uuid.uuid4().hex
+
+        atomic_save({**checkpoint, SNAPSHOT_ID_KEY: snapshot_id}, filepath)
+        self._bases[checkpoint_type] = (snapshot_id, digests(checkpoint))
+
+        # the delta of the previous snapshot is compacted into this one
+        remove(delta_filepath)
+
+    def _save_delta(self, checkpoint: Dict[str, Any], checkpoint_type: str, filepath: str, delta_filepath: str):
+        if checkpoint_type not in self._bases:
+            # the full snapshot this delta was planned against was replaced by a newer save
+            self._save_full(checkpoint, checkpoint_type, filepath, delta_filepath)
+            return
+
+        snapshot_id, base_digests = self._bases[checkpoint_type]
+
+        delta = make_delta(checkpoint, base_digests)
+        delta[BASE_SNAPSHOT_ID_KEY] = snapshot_id
+
+        atomic_save(delta, delta_filepath)
+
+    def _publish_saved(self):
+        # saved events are published from the training thread, once the writer has finished a file
+        for checkpoint_type, duration in self._writer.completed():
+            self.pub(CheckpointSavedEvent(checkpoint_type=checkpoint_type, duration=duration))
+
+    def _load_checkpoint(self,
+                         checkpoint_type: str,
+                         filepath: str,
+                         keys: Optional[List[str]] = None,
+                         delta_filepath: Optional[str] = None):
+        self.pub(CheckpointLoadingEvent(checkpoint_type=checkpoint_type, keys=keys))
+
+        checkpoint, mapped = self._read(filepath)
+
+        if delta_filepath is not None and os.path.exists(delta_filepath):
+            delta, _ = self._read(delta_filepath)
+
+            # a delta is only valid on top of the full snapshot it was made against
+            if delta.pop(BASE_SNAPSHOT_ID_KEY, None) == checkpoint.get(SNAPSHOT_ID_KEY):
+                checkpoint = apply_delta(checkpoint, delta)
+
+        checkpoint.pop(SNAPSHOT_ID_KEY, None)
+
+        if keys is not None:
+            # with mmap the tensors of dropped parts are never read from disk
+            checkpoint = {key: checkpoint[key] for key in keys if key in checkpoint}
+
+        if mapped and self._map_location is not None:
+            checkpoint = _move(checkpoint, self._map_location)
 
         self.pub(CheckpointLoadedEvent(checkpoint=checkpoint, checkpoint_type=checkpoint_type))
+
+    def _read(self, filepath: str) -> Tuple[Dict[str, Any], bool]:
+        if self._mmap:
+            try:
+                # tensors stay backed by the file until they are used, they are moved after filtering
+                return torch.load(filepath, map_location="cpu", mmap=True), True
+            except RuntimeError:
+                # mmap needs the zipfile format, checkpoints in the legacy format are read fully
+                pass
+
+        return torch.load(filepath, map_location=self._map_location), False
+
+
+def _supports_mmap() -> bool:
+    try:
+        return "mmap" in inspect.signature(torch.load).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _move(obj: Any, location) -> Any:
+    if isinstance(obj, torch.Tensor):
+        return obj.to(location)
+
+    if isinstance(obj, dict):
+        return type(obj)((key, _move(value, location)) for key, value in obj.items())
+
+    if isinstance(obj, (list, tuple)) and not hasattr(obj, "_fields"):
+        return type(obj)(_move(value, location) for value in obj)
+
+    return obj
@@ -0,0 +1,67 @@
+import copy
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from ..constants import MetricMode
+
+
+class CheckpointIndex:
+    def __init__(self, filepath: str):
+        self._filepath = filepath
+
+        # epoch_index -> {"epoch_index", "filename", "metrics": metric_name->loader_name->value}
+        self._entries: Dict[int, Dict[str, Any]] = {}
+
+        if os.path.exists(self._filepath):
+            with open(self._filepath, "r") as file:
+                entries = json.load(file)["entries"]
+
+            self._entries = {int(epoch_index): entry for epoch_index, entry in entries.items()}
+
+    @property
+    def filepath(self) -> str:
+        return self._filepath
+
+    def get(self, epoch_index: int) -> Optional[Dict[str, Any]]:
+        return self._entries.get(epoch_index)
+
+    def add(self, epoch_index: int, filename: str, metrics: Dict[str, Dict[int, Dict[str, float]]]):
+        self._entries[epoch_index] = {"epoch_index": epoch_index, "filename": filename, "metrics": {}}
+        self.update(metrics)
+
+    def update(self, metrics: Dict[str, Dict[int, Dict[str, float]]]):
+        for metric_name, epochs in metrics.items():
+            for epoch_index, loaders in epochs.items():
+                if epoch_index in self._entries:
+                    self._entries[epoch_index]["metrics"][metric_name] = dict(loaders)
+
+    def evict(self,
+              keep_last: int,
+              keep_top_k: int,
+              metric_name: str,
+              loader_name: str,
+              metric_mode: str) -> List[Dict[str, Any]]:
+        epochs = sorted(self._entries)
+        kept = set(epochs[-keep_last:]) if keep_last > 0 else set()
+
+        if keep_top_k > 0:
+            ranked = [(self._value(epoch_index, metric_name, loader_name), epoch_index) for epoch_index in epochs]
+            ranked = [(value, epoch_index) for value, epoch_index in ranked if value is not None]
+            ranked.sort(reverse=metric_mode == MetricMode.Max)
+            kept.update(epoch_index for _, epoch_index in ranked[:keep_top_k])
+
+            # the newest entry may still wait for its metrics
+            if epochs and self._value(epochs[-1], metric_name, loader_name) is None:
+                kept.add(epochs[-1])
+
+        return [self._entries.pop(epoch_index) for epoch_index in epochs if epoch_index not in kept]
+
+    def to_dict(self) -> Dict[str, Any]:
+        # a copy, the writer thread serializes it while the entries keep changing
+        entries = {str(epoch_index): copy.deepcopy(entry) for epoch_index, entry in sorted(self._entries.items())}
+
+        return {"entries": entries}
+
+    def _value(self, epoch_index: int, metric_name: str, loader_name: str) -> Optional[float]:
+        return self._entries[epoch_index]["metrics"].get(metric_name, {}).get(loader_name)
@@ -1,3 +1,5 @@
+from typing import Any, Dict, List, Optional
+
 import torch
 from decouple import Module
 
@@ -9,24 +11,33 @@ from .events import (
     StateSaveEvent,
     StateLoadEvent
 )
-from ..constants import StateMode
+from ..constants import LoaderName, StateMode
+from ..events import StateCollectEvent, StateRestoreEvent
+from ..loader import LoaderProcessBatchEndEvent
 from ..model import ModelInitEvent, ModelSaveLastEvent, ModelSaveBestEvent
 from ..runner import Runner
-from ..settings import STATE_MANAGER_STATE_MODE
+from ..settings import STATE_MANAGER_STATE_MODE, STATE_MANAGER_SAVE_EVERY_STEPS
+from ..utils import rng_state, set_rng_state
 
 
 class StateManager(Module):
     def __init__(self,
                  mode: str = STATE_MANAGER_STATE_MODE,
+                 epoch_index: Optional[int] = None,
+                 save_every_steps: int = STATE_MANAGER_SAVE_EVERY_STEPS,
                  ):
         super().__init__()
 
         self._mode = mode
+        self._epoch_index = epoch_index
+        self._save_every_steps = save_every_steps
+        self._train_steps = 0
 
         self._runner: Runner = None
         self._model: torch.nn.Module = None
         self._optimizer = None
         self._scheduler = None
+        self._scaler = None
 
         (
             self.sub(CheckpointSavingEvent, self.handle_checkpoint_saving)
@@ -38,6 +49,9 @@ class StateManager(Module):
                 .sub(ModelSaveBestEvent, self.handle_model_save_best)
         )
 
+        if self._save_every_steps > 0:
+            self.sub(LoaderProcessBatchEndEvent, self.handle_process_batch_end)
+
     def handle_checkpoint_saving(self, event: CheckpointSavingEvent):
         pass
 
@@ -48,42 +62,110 @@ class StateManager(Module):
         pass
 
     def handle_checkpoint_loaded(self, event: CheckpointLoadedEvent):
-        model_state_dict = event.checkpoint["model_state_dict"]
-        self._model.load_state_dict(model_state_dict)
+        checkpoint = event.checkpoint
+
+        if "model_state_dict" in checkpoint:
+            self._model.load_state_dict(checkpoint["model_state_dict"])
+
+        if self._optimizer is not None and "optimizer_state_dict" in checkpoint:
+            self._optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
+
+        if self._scheduler is not None and "scheduler_state_dict" in checkpoint:
+            self._scheduler.load_state_dict(checkpoint["scheduler_state_dict"])
+
+        if self._scaler is not None and "scaler_state_dict" in checkpoint:
+            self._scaler.load_state_dict(checkpoint["scaler_state_dict"])
+
+        if "epoch_index" in checkpoint:
+            self._runner.current_epoch_index = checkpoint["epoch_index"]
 
-        optimizer_state_dict = event.checkpoint["optimizer_state_dict"]
-        self._optimizer.load_state_dict(optimizer_state_dict)
+        # loader positions, rng and module states continue an interrupted epoch where it stopped
+        if "runner_state" in checkpoint:
+            self._runner.load_state_dict(checkpoint["runner_state"])
 
-        scheduler_state_dict = event.checkpoint["scheduler_state_dict"]
-        self._scheduler.load_state_dict(scheduler_state_dict)
+        if "rng_state" in checkpoint:
+            set_rng_state(checkpoint["rng_state"])
 
-        epoch_index = event.checkpoint["epoch_index"]
-        self._runner.current_epoch_index = epoch_index
+        if "module_state" in checkpoint:
+            self.pub(StateRestoreEvent(state=checkpoint["module_state"]))
 
     def handle_model_save_last(self, event: ModelSaveLastEvent):
-        state = {
-            "model_state_dict": event.model.state_dict(),
-            "optimizer_state_dict": event.optimizer.state_dict(),
-            "scheduler_state_dict": event.scheduler.state_dict(),
-            "epoch_index": event.epoch_index
-        }
+        state = self._state(model=event.model,
+                            optimizer=event.optimizer,
+                            scheduler=event.scheduler,
+                            scaler=event.scaler,
+                            epoch_index=event.epoch_index,
+                            state_type=StateMode.Last)
 
         self.pub(StateSaveEvent(state=state, state_type=StateMode.Last))
 
     def handle_model_save_best(self, event: ModelSaveBestEvent):
+        state = self._state(model=event.model,
+                            optimizer=event.optimizer,
+                            scheduler=event.scheduler,
+                            scaler=event.scaler,
+                            epoch_index=event.epoch_index,
+                            state_type=StateMode.Best)
+
+        self.pub(StateSaveEvent(state=state, state_type=StateMode.Best))
+
+    def handle_process_batch_end(self, event: LoaderProcessBatchEndEvent):
+        if event.loader.name != LoaderName.Train or self._optimizer is None:
+            return
+
+        self._train_steps += 1
+
+        if self._train_steps % self._save_every_steps == 0:
+            # the current epoch is not finished yet, a resume starts it again
+            state = self._state(model=self._model,
+                                optimizer=self._optimizer,
+                                scheduler=self._scheduler,
+                                scaler=self._scaler,
+                                epoch_index=event.epoch_index - 1,
+                                state_type=StateMode.Last)
+
+            self.pub(StateSaveEvent(state=state, state_type=StateMode.Last, step_save=True))
+
+    def _state(self, model, optimizer, scheduler, scaler, epoch_index: int, state_type: str) -> Dict[str, Any]:
         state = {
-            "model_state_dict": event.model.state_dict(),
-            "optimizer_state_dict": event.optimizer.state_dict(),
-            "scheduler_state_dict": event.scheduler.state_dict(),
-            "epoch_index": event.epoch_index
+            "model_state_dict": model.state_dict(),
+            "optimizer_state_dict": optimizer.state_dict(),
+            "scheduler_state_dict": scheduler.state_dict(),
+            "epoch_index": epoch_index
         }
 
-        self.pub(StateSaveEvent(state=state, state_type=StateMode.Best))
+        if scaler is not None:
+            state["scaler_state_dict"] = scaler.state_dict()
+
+        state["runner_state"] = self._runner.state_dict()
+        state["rng_state"] = rng_state()
+
+        module_state = {}
+        self.pub(StateCollectEvent(state=module_state, state_type=state_type))
+        state["module_state"] = module_state
+
+        return state
 
     def handle_model_init(self, event: ModelInitEvent):
         self._runner = event.runner
         self._model = event.model
         self._optimizer = event.optimizer
         self._scheduler = event.scheduler
+        self._scaler = event.scaler
+
+        self.pub(StateLoadEvent(state_type=self._mode, keys=self._state_keys(), epoch_index=self._epoch_index))
+
+    def _state_keys(self) -> List[str]:
+        # only the parts something will be restored into are read, inference needs the weights only
+        keys = ["model_state_dict"]
+
+        if self._optimizer is not None:
+            keys += ["optimizer_state_dict", "epoch_index", "runner_state", "rng_state", "module_state"]
+
+        if self._scheduler is not None:
+            keys.append("scheduler_state_dict")
+
+        if self._scaler is not None:
+            keys.append("scaler_state_dict")
 
-        self.pub(StateLoadEvent(state_type=self._mode))
+        return keys
@@ -0,0 +1,159 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+
+
+def snapshot(obj: Any) -> Any:
+    # state dicts share storage with live parameters, so tensors are copied before the training goes on
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+
+    if isinstance(obj, dict):
+        return type(obj)((key, snapshot(value)) for key, value in obj.items())
+
+    if isinstance(obj, (list, tuple)) and not hasattr(obj, "_fields"):
+        return type(obj)(snapshot(value) for value in obj)
+
+    return obj
+
+
+def atomic_save(obj: Any, filepath: str):
+    _atomic_write(filepath, lambda file: torch.save(obj, file))
+
+
+def atomic_save_json(obj: Any, filepath: str):
+    _atomic_write(filepath, lambda file: file.write(json.dumps(obj, indent=2).encode("utf-8")))
+
+
+def remove(filepath: str):
+    if os.path.exists(filepath):
+        os.remove(filepath)
+
+
+def remove_stale(folder: str):
+    # temporary files of writes that were interrupted by a crash, they are never renamed over a checkpoint
+    for filename in os.listdir(folder):
+        if filename.startswith(".") and filename.endswith(".tmp"):
+            remove(os.path.join(folder, filename))
+
+
+def _atomic_write(filepath: str, write: Callable[[Any], Any]):
+    # written next to the target and renamed over it, so a crash never leaves a half-written file
+    folder = os.path.dirname(filepath) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(filepath)}.", suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class CheckpointWriter:
+    def __init__(self):
+        # filepath -> (operation, checkpoint_type), a newer operation on the same file replaces a pending one
+        self._pending: Dict[str, Tuple[Callable[[], None], Optional[str]]] = OrderedDict()
+        # (checkpoint_type, seconds) of the files written since the last call to completed
+        self._completed: List[Tuple[str, float]] = []
+        self._error: Optional[BaseException] = None
+
+        self._busy = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    # the checkpoint must already be a host copy, see snapshot
+    def submit(self, checkpoint: Dict[str, Any], checkpoint_type: Optional[str], filepath: str):
+        self.queue(filepath, lambda: atomic_save(checkpoint, filepath), checkpoint_type)
+
+    def submit_json(self, obj: Any, filepath: str):
+        self.queue(filepath, lambda: atomic_save_json(obj, filepath))
+
+    def remove(self, filepath: str):
+        self.queue(filepath, lambda: remove(filepath))
+
+    def queue(self, filepath: str, operation: Callable[[], None], checkpoint_type: Optional[str] = None):
+        self._raise_error()
+
+        with self._condition:
+            self._pending.pop(filepath, None)
+            self._pending[filepath] = (operation, checkpoint_type)
+            self._closed = False
+            self._start()
+            self._condition.notify_all()
+
+    def completed(self) -> List[Tuple[str, float]]:
+        with self._condition:
+            completed, self._completed = self._completed, []
+
+        return completed
+
+    def flush(self):
+        with self._condition:
+            while self._pending or self._busy:
+                self._condition.wait()
+
+        self._raise_error()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self._raise_error()
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="convolut-checkpoint-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+
+                if not self._pending:
+                    return
+
+                _, (operation, checkpoint_type) = self._pending.popitem(last=False)
+                self._busy = True
+
+            try:
+                started = time.perf_counter()
+                operation()
+                duration = time.perf_counter() - started
+            except BaseException as e:
+                with self._condition:
+                    self._error = e
+            else:
+                if checkpoint_type is not None:
+                    with self._condition:
+                        self._completed.append((checkpoint_type, duration))
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _raise_error(self):
+        with self._condition:
+            error, self._error = self._error, None
+
+        if error is not None:
+            raise error
@@ -1,4 +1,5 @@
-from .dice import dice
+from .dice import dice, dice_stats, reduce_dice
 from .loader import valid_every_n
+from .rng import rng_state, set_rng_state
 
-__all__ = ["dice", "valid_every_n"]
+__all__ = ["dice", "dice_stats", "reduce_dice", "valid_every_n", "rng_state", "set_rng_state"]
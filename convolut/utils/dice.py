@@ -1,26 +1,104 @@
-from typing import Optional
+from typing import Callable, Optional, Tuple, Union
 
 import torch
-from torch import nn
 
+from ..constants import Activation, DiceReduction
 
-def dice(
+
+def _activate(output: torch.Tensor, activation: Optional[Union[str, Callable]]) -> torch.Tensor:
+    if activation is None:
+        return output
+
+    if activation == Activation.Sigmoid:
+        return torch.sigmoid(output)
+
+    if activation == Activation.Softmax:
+        return torch.softmax(output, dim=1)
+
+    if callable(activation):
+        return activation(output)
+
+    raise ValueError(f'unknown activation={activation}')
+
+
+def _one_hot(target: torch.Tensor, output: torch.Tensor) -> torch.Tensor:
+    if target.shape == output.shape:
+        return target.to(output.dtype)
+
+    if target.dim() == output.dim() and target.size(1) == 1:
+        target = target.squeeze(1)
+
+    # index targets [batch, *spatial] are compared against every class at once
+    classes = torch.arange(output.size(1), device=target.device).view(1, -1, *([1] * (target.dim() - 1)))
+
+    return (target.unsqueeze(1) == classes).to(output.dtype)
+
+
+def dice_stats(
         output: torch.Tensor,
         target: torch.Tensor,
-        eps: float = 1e-7,
-        threshold: float = None,
-        activation: Optional[nn.Module] = nn.Sigmoid(),
-):
-    activation = activation if activation else lambda x: x
+        threshold: Optional[float] = None,
+        activation: Optional[Union[str, Callable]] = Activation.Sigmoid,
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    # output is [batch, classes, *spatial], 1d outputs are a single class
+    if output.dim() == 1:
+        output = output.unsqueeze(1)
+        target = target.reshape(output.shape)
 
-    output = activation(output)
+    output = _activate(output, activation)
 
     if threshold is not None:
-        output = (output > threshold).float()
+        output = (output > threshold).to(output.dtype)
+
+    target = _one_hot(target, output)
+
+    # only the spatial dimensions are reduced, every result is [batch, classes]
+    dims = tuple(range(2, output.dim()))
 
-    intersection = torch.sum(target * output)
-    union = torch.sum(target) + torch.sum(output)
+    if not dims:
+        return output * target, output, target
 
-    result = 2 * intersection / (union + eps)
+    return torch.sum(output * target, dim=dims), torch.sum(output, dim=dims), torch.sum(target, dim=dims)
+
+
+def reduce_dice(
+        intersection: torch.Tensor,
+        output_sum: torch.Tensor,
+        target_sum: torch.Tensor,
+        eps: float = 1e-7,
+        reduction: str = DiceReduction.Micro,
+        weights: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    if reduction == DiceReduction.NoReduction:
+        return 2 * intersection / (output_sum + target_sum + eps)
+
+    if reduction == DiceReduction.Micro:
+        return 2 * torch.sum(intersection) / (torch.sum(output_sum) + torch.sum(target_sum) + eps)
+
+    target_sum = torch.sum(target_sum, dim=0)
+    per_class = 2 * torch.sum(intersection, dim=0) / (torch.sum(output_sum, dim=0) + target_sum + eps)
+
+    if reduction == DiceReduction.Macro:
+        return torch.mean(per_class)
+
+    if reduction == DiceReduction.Weighted:
+        # classes are weighted by their share of the target unless weights are given
+        weights = target_sum if weights is None else weights.to(per_class)
+
+        return torch.sum(per_class * weights) / (torch.sum(weights) + eps)
+
+    raise ValueError(f'unknown reduction={reduction}')
+
+
+def dice(
+        output: torch.Tensor,
+        target: torch.Tensor,
+        eps: float = 1e-7,
+        threshold: float = None,
+        activation: Optional[Union[str, Callable]] = Activation.Sigmoid,
+        reduction: str = DiceReduction.Micro,
+        weights: Optional[torch.Tensor] = None,
+):
+    intersection, output_sum, target_sum = dice_stats(output, target, threshold, activation)
 
-    return result
+    return reduce_dice(intersection, output_sum, target_sum, eps, reduction, weights)
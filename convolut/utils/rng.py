@@ -0,0 +1,46 @@
+import random
+from typing import Any, Dict
+
+import torch
+
+
+def rng_state() -> Dict[str, Any]:
+    state = {
+        "python": random.getstate(),
+        "torch": torch.get_rng_state(),
+    }
+
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+
+    try:
+        import numpy as np
+    except ImportError:
+        return state
+
+    # stored as plain values and tensors, checkpoints are loaded with weights_only
+    name, keys, position, has_gauss, cached_gaussian = np.random.get_state()
+    state["numpy"] = (name, torch.from_numpy(keys.astype(np.int64)), position, has_gauss, cached_gaussian)
+
+    return state
+
+
+def set_rng_state(state: Dict[str, Any]):
+    random.setstate(_as_tuple(state["python"]))
+    torch.set_rng_state(state["torch"])
+
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+    if "numpy" in state:
+        import numpy as np
+
+        name, keys, position, has_gauss, cached_gaussian = state["numpy"]
+        np.random.set_state((name, keys.numpy().astype(np.uint32), position, has_gauss, cached_gaussian))
+
+
+def _as_tuple(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return tuple(_as_tuple(item) for item in value)
+
+    return value
@@ -11,6 +11,8 @@ from convolut.logger import ConsoleLogger
 from convolut.logger import FileLogger
 from convolut.metric import LossMetric
 from convolut.model import ModelManager
+from convolut.profiler import TraceProfiler
+from convolut.settings import PROFILER_TRACE_ENABLED
 from convolut.state import FileCheckpoint
 from convolut.trigger.early_stopper import EarlyStopper
 # from convolut_tensorboard import TensorboardLogger
@@ -67,7 +69,7 @@ criterion = F.nll_loss
 
 # RUNNER INITIALIZATION AND RUN
 epochs = 10
-(
+runner = (
     Runner(loaders=[train_loader, valid_loader], epochs=epochs, steps_per_epoch=10)
         # append model training module
         .add(ModelManager(model=model,
@@ -89,5 +91,10 @@ epochs = 10
         .add(ConsoleLogger())
         .add(FileLogger())
         # .add(TensorboardLogger())
-        .start()
 )
+
+# CONVOLUT_PROFILER_TRACE_ENABLED=true captures a trace without changing the script
+if PROFILER_TRACE_ENABLED:
+    runner.add(TraceProfiler())
+
+runner.start()
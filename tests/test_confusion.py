@@ -0,0 +1,74 @@
+import pytest
+import torch
+from decouple import Mediator, Registry
+
+from convolut.loader import TrainLoader, LoaderStartEvent, LoaderEndEvent
+from convolut.metric import ConfusionMatrixMetric, MetricEvent
+from convolut.model import ModelLossStartEvent
+
+
+def run(metric: ConfusionMatrixMetric, output: torch.Tensor, target: torch.Tensor):
+    mediator = Mediator(Registry())
+    metric.init(mediator)
+
+    metrics = {}
+    mediator.add(MetricEvent, lambda event: metrics.update({event.metric_name: event.metric_value}))
+
+    loader = TrainLoader(dataloader=[])
+    mediator.pub(LoaderStartEvent(loader=loader, epoch_index=1))
+    mediator.pub(ModelLossStartEvent(output=output, target=target, loader_name=loader.name,
+                                     epoch_index=1, step_index=0, batch_index=0))
+    mediator.pub(LoaderEndEvent(loader=loader, epoch_index=1))
+
+    return metrics
+
+
+def one_hot_output(prediction, num_channels):
+    # (samples, channels, 1) logits whose argmax is the given prediction
+    output = torch.nn.functional.one_hot(torch.tensor(prediction), num_channels).float()
+    return output.view(len(prediction), num_channels, 1)
+
+
+def test_ignore_index_is_left_out():
+    output = one_hot_output([0, 1, 2, 2], 3)
+    target = torch.tensor([[0], [1], [255], [2]])
+
+    metrics = run(ConfusionMatrixMetric(prefix="cm", ignore_index=255), output, target)
+
+    assert metrics["cm.accuracy"] == 1.0
+
+
+def test_unmasked_label_above_num_classes_raises():
+    output = one_hot_output([0, 1, 2, 2], 3)
+    target = torch.tensor([[0], [1], [255], [2]])
+
+    with pytest.raises(ValueError):
+        run(ConfusionMatrixMetric(prefix="cm"), output, target)
+
+
+def test_negative_label_raises():
+    output = one_hot_output([0, 1, 2], 3)
+    target = torch.tensor([[0], [-1], [2]])
+
+    with pytest.raises(ValueError):
+        run(ConfusionMatrixMetric(prefix="cm"), output, target)
+
+
+def test_more_channels_than_classes_raises():
+    output = one_hot_output([0, 1, 3], 4)
+    target = torch.tensor([[0], [1], [2]])
+
+    with pytest.raises(ValueError):
+        run(ConfusionMatrixMetric(prefix="cm", num_classes=3), output, target)
+
+
+def test_absent_class_is_left_out_of_the_mean():
+    # class 2 is neither predicted nor present, its precision and recall are undefined
+    output = one_hot_output([0, 1, 1, 1], 3)
+    target = torch.tensor([[0], [1], [1], [0]])
+
+    metrics = run(ConfusionMatrixMetric(prefix="cm", per_class=True), output, target)
+
+    assert metrics["cm.recall.class_0"] == 0.5
+    assert metrics["cm.recall.class_1"] == 1.0
+    assert metrics["cm.recall"] == pytest.approx(0.75)